@@ -15,24 +15,24 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import datetime
-
 from tkinter import *
 from tkinter import messagebox
 
-from classes import Band
-from classes import LineUp
 from classes import Settings
 from classes import Stage
 
 from utils import get_day_str
+from utils import get_selected_bands
 from utils import browse_files
 from utils import get_multi_bands
 from utils import clear_selection
 from utils import export_selection
 from utils import import_selection
-from utils import print_running_order
+from utils import ask_running_order_print
+from utils import ask_crew_selection
+from utils import import_walking_times
 from utils import save_settings
+from utils import warm_up_render_stack
 from utils import get_alias_table_data
 from utils import prepare_data_for_alias_table
 from utils import correct_row_keys
@@ -40,7 +40,21 @@ from utils import import_alias_settings
 from utils import export_alias_settings
 
 from custom_table import CustomTable
-
+from lineup_watcher import LineUpWatcher
+from background_render import BackgroundRender
+from background_render import RenderWorker
+from band_search import BandSearchIndex
+from preview import RunningOrderPreview
+from ical_export import export_ical
+from ical_export import export_ical_batch
+from analytics import get_statistics_report
+from lineup_lint import get_lint_messages
+from lineup_lint import lint_lineup
+from journal import SelectionJournal
+
+
+# the most findings of the line-up check shown at once, all of them are printed
+MAX_SHOWN_LINT_MESSAGES = 20
 
 # The main window
 window = Tk()
@@ -53,100 +67,154 @@ def add_stages_to_gui(stage_names):
     if not stages:
         stages = []
 
-    # create stage objects in the global list
+    # create stage objects in the global list. stages that are already known keep their selection
+    known_stage_names = [stage.name for stage in stages]
+    new_stages = []
     for stage in stage_names:
-        s = Stage(stage)
-        stages.append(s)
+        if stage not in known_stage_names:
+            s = Stage(stage)
+            stages.append(s)
+            new_stages.append(s)
 
     # add a line with checkbox and label to the main window
     # to enable stage selection
-    for stage in stages:
+    for stage in new_stages:
         stage.create_selection_gui(window)
 
 
-def parse_lineup(file_path) -> LineUp:
-    """ Parse the line-up from a file """
-    stage_names = []
-    bands = []
+def report_lineup_lint():
+    lint_messages = get_lint_messages(lint_lineup(lineup), lineup)
+    if len(lint_messages) == 0:
+        return
 
-    # first thing is to increase the line number, so we can set it to 0, then we "start" at 1
-    line_number = 0
-    for line in open(file_path, 'r', encoding='utf-8'):
-        line_number += 1
-        if line.startswith('Band') or line.startswith('#') or line == "\n" or not line:
-            # ignore the line, as it is only for description or comment
-            continue
+    for message in lint_messages:
+        print(message)
+    shown_messages = lint_messages[:MAX_SHOWN_LINT_MESSAGES]
+    if len(lint_messages) > MAX_SHOWN_LINT_MESSAGES:
+        shown_messages.append('... and {0} more'.format(len(lint_messages) - MAX_SHOWN_LINT_MESSAGES))
+    messagebox.showwarning('Line-up check', 'The line-up may contain mistakes:\n' + '\n'.join(shown_messages))
+
+
+def open_selection_journal(file_path):
+    """ Restore the selection and aliases of the last session with this line-up, and keep saving them """
+    global selection_journal
+    global band_alias_dict
+    if selection_journal is not None:
+        selection_journal.close()
+        selection_journal = None
 
-        data = line.split(',')
-        # set up the variables in this scope
-        name = ""
-        date = ""
-        start = ""
-        end = ""
-        stage = ""
-        try:
-            name = data[0]
-            date = data[1]
-            start = data[2]
-            end = data[3]
-            stage = data[4].replace('\n', '')
-        except:
-            print("Could not parse line ", line, " at line ", line_number)
-        if not stage_names.__contains__(stage):
-            stage_names.append(stage)
-
-        date_object = ""
-        try:
-            date_object = datetime.datetime.strptime(date, '%d.%m.%Y')
-        except:
-            # TODO: open window showing the user an error occurred and where it occured
-            err_msg = 'Could not parse date on line ' + str(line_number) + '\n'
-            err_msg += 'Invalid line: ' + line
-            messagebox.showerror('Parsing error', err_msg)
-            return
-
-        # parse the time and fit the date to it for a correct datetime object
-        start_time_object = datetime.datetime.strptime(start, '%H:%M')
-        end_time_object = datetime.datetime.strptime(end, '%H:%M')
-        date_object = date_object.replace(hour=start_time_object.hour)
-        date_object = date_object.replace(minute=start_time_object.minute)
-        end_time_object = end_time_object.replace(year=date_object.year)
-        end_time_object = end_time_object.replace(month=date_object.month)
-        end_time_object = end_time_object.replace(day=date_object.day)
-
-        bands.append(Band(name, stage, date_object, end_time_object))
-
-    # sort the bands into the days
-    days = {}
-    for band in bands:
-        date = band.start
-        # for a check if the date was found before (and thus if an entry exists in the dictionary)
-        # the time needs to be equal. the days contain no times, therefore set them 0 here as well
-        date = date.replace(hour=0).replace(minute=0)
-
-        if not days.__contains__(date):
-            days[date] = []
-
-        days[date].append(band)
-
-    return LineUp(stage_names, days, bands)
+    try:
+        selection_journal = SelectionJournal(file_path)
+    except (OSError, ValueError) as e:
+        print("Could not restore the last session: ", e)
+        return
+
+    if len(selection_journal.aliases) > 0:
+        band_alias_dict = dict(selection_journal.aliases)
+    else:
+        # keep aliases made before parsing
+        selection_journal.record_aliases(band_alias_dict)
+
+
+def record_band_toggle(band, is_checked):
+    if selection_journal is not None:
+        selection_journal.record_toggle(band, is_checked.get() == 1)
+
+
+def close_window():
+    # write the last changes to the journal before quitting
+    if selection_journal is not None:
+        selection_journal.close()
+    window.destroy()
 
 
 def execute_parsing(file_path, buttons_to_activate):
     # we want to write to the global line-up, thus we don't have to carry it about as a parameter
     global lineup
-    lineup = parse_lineup(file_path)
+    global lineup_watcher
+    global band_search_index
+    lineup_watcher = LineUpWatcher(file_path)
+    lineup = lineup_watcher.lineup
     if lineup is not None:
+        open_selection_journal(file_path)
+        band_search_index = BandSearchIndex(lineup.bands, band_alias_dict)
         for button in buttons_to_activate:
             button['state'] = NORMAL
 
         # add the stages to the main window for en-/disabling and sorting
         add_stages_to_gui(lineup.stages)
 
+        # the line-up is usable anyway, but typos in stage names or times are easier to fix right away
+        report_lineup_lint()
+
+
+def watch_lineup_file():
+    """ Parse the line-up file again whenever it changes, and print the days affected by the changes again """
+    global lineup
+
+    # a print that is still running uses the current line-up, therefore wait for it to finish
+    is_rendering = current_render is not None and current_render.is_running
+    if (watch_is_checked.get() == 1 and not is_rendering
+            and lineup_watcher is not None and lineup_watcher.has_changed()):
+        affected_days = lineup_watcher.update()
+        if affected_days is not None:
+            lineup = lineup_watcher.lineup
+            add_stages_to_gui(lineup.stages)
+
+            if last_print is not None and len(affected_days) > 0:
+                last_print.band_alias_dict = band_alias_dict
+                render_in_background(last_print, affected_days)
+
+    # there is no portable way to be notified about file changes, therefore just check regularly
+    window.after(1000, watch_lineup_file)
+
+
+def render_in_background(running_order_print, days=None):
+    global current_render
+    current_render = BackgroundRender(window, render_worker, running_order_print, lineup, settings, stages, days)
+
+
+def create_running_order(bands_dict=None, crew_selection=None):
+    # remember the print, so it can be redone when the line-up file changes
+    global last_print
+    running_order_print = ask_running_order_print(bands_dict, band_alias_dict, crew_selection, walking_times)
+    if running_order_print is None:
+        return
+
+    last_print = running_order_print
+    render_in_background(running_order_print)
+
+
+def use_walking_times():
+    # keep the walking times of the last import, if the user canceled
+    global walking_times
+    imported_walking_times = import_walking_times()
+    if imported_walking_times is not None:
+        walking_times = imported_walking_times
+
+
+def create_crew_heatmap():
+    crew_selection = ask_crew_selection(lineup, walking_times)
+    if crew_selection is not None:
+        create_running_order(None, crew_selection)
+
+
+def show_statistics(bands_dict=None):
+    selection = None
+    if bands_dict is not None:
+        selection = get_selected_bands(lineup, bands_dict)
+    messagebox.showinfo('Line-up statistics', get_statistics_report(lineup, selection))
+
 
 def use_table_data(alias_window, table: CustomTable):
     global band_alias_dict
+    global band_search_index
     band_alias_dict = get_alias_table_data(table)
+    if selection_journal is not None:
+        selection_journal.record_aliases(band_alias_dict)
+    # the aliases can be searched for as well
+    if lineup is not None:
+        band_search_index = BandSearchIndex(lineup.bands, band_alias_dict)
 
     print(band_alias_dict)
     if len(band_alias_dict) == 0:
@@ -217,6 +285,62 @@ def open_band_alias_window():
     export_button.grid(row=2, column=1)
 
 
+def get_band_search_index() -> BandSearchIndex:
+    # the index is built when parsing, but the line-up or the aliases may have changed since
+    global band_search_index
+    if band_search_index is None or band_search_index.bands is not lineup.bands:
+        band_search_index = BandSearchIndex(lineup.bands, band_alias_dict)
+
+    return band_search_index
+
+
+def layout_band_widgets(band_widgets, band_order, band_positions, visible_bands=None):
+    # the alphabetical order should be displayed downwards first, then to the right second
+    # (e.g:     Aborted             Arch Enemy      Blind Guardian
+    #           Amon Amarth         Benediction     Bloodshot Dawn
+    #           Anaal Nathrakh      Benighted       Cannibal Corpse)
+    #
+    # for this to work, we need to know the number of bands before starting to lay them out
+    num_bands = len(band_order)
+    if visible_bands is not None:
+        num_bands = len(visible_bands)
+
+    # if we set the max_columns we want to use, we can see how many rows we get
+    max_columns = 6
+    max_rows = int(num_bands / max_columns)
+
+    new_positions = {}
+    row = 0
+    column = 0
+    for i in band_order:
+        if visible_bands is not None and i not in visible_bands:
+            continue
+
+        new_positions[i] = (row, column)
+
+        row += 1
+        if row > max_rows:
+            row = 0
+            column += 1
+
+    # placing a widget makes tk lay out the band frame again, which takes long with thousands of bands.
+    # band_positions holds the cell of every band shown so far, only the bands hidden, shown or moved are placed
+    for i in band_positions:
+        if i not in new_positions:
+            band_checkbox, band_label = band_widgets[i]
+            band_checkbox.grid_remove()
+            band_label.grid_remove()
+
+    for i, (row, column) in new_positions.items():
+        if band_positions.get(i) != (row, column):
+            band_checkbox, band_label = band_widgets[i]
+            band_checkbox.grid(row=row, column=2*column)
+            band_label.grid(row=row, column=2*column+1)
+
+    band_positions.clear()
+    band_positions.update(new_positions)
+
+
 def open_band_selection_window():
     selection_window = Toplevel(window)
     selection_window.title("Band selection for Personal Running Order")
@@ -229,44 +353,37 @@ def open_band_selection_window():
 
     # we will want one section with all the bands to choose from, and one with buttons to click
     # to keep them separated and thus not screwing up the layout, put them into individual frames
+    search_frame = Frame(selection_window)
+    search_frame.grid(row=0, column=0)
     band_frame = Frame(selection_window)
-    band_frame.grid(row=0, column=0)
+    band_frame.grid(row=1, column=0)
     control_frame = Frame(selection_window)
-    control_frame.grid(row=1, column=0)
+    control_frame.grid(row=2, column=0)
+    preview_frame = Frame(selection_window)
+    preview_frame.grid(row=0, column=1, rowspan=3)
 
     # get every band that is featured more than once
     multi_bands = get_multi_bands(lineup)
 
     # sort bands alphabetically primarily and for start date secondarily
-    bands_list = []
-    for band in lineup.bands:
-        bands_list.append(band)
-    bands_list.sort()
-
-    # the alphabetical order should be displayed downwards first, then to the right second
-    # (e.g:     Aborted             Arch Enemy      Blind Guardian
-    #           Amon Amarth         Benediction     Bloodshot Dawn
-    #           Anaal Nathrakh      Benighted       Cannibal Corpse)
-    #
-    # for this to work, we need to know the number of bands before starting to lay them out
-    num_bands = len(bands_list)
-
-    # if we set the max_columns we want to use, we can see how many rows we get
-    max_columns = 6
-    max_rows = int(num_bands / max_columns)
+    # the bands are referred to by their position in the line-up, the same way the search index does
+    band_order = sorted(range(len(lineup.bands)), key=lambda i: lineup.bands[i])
 
     # store all bands in a dictionary, where the value is the variable
     # the checkbox's state can be read and written to via the variable
     bands_dict = {}
+    # the checkbox and label of every band, to show only the ones matching the search
+    band_widgets = {}
+    # the grid cell of every band shown right now
+    band_positions = {}
 
     # parse all the bands and list them
-    row = 0
-    column = 0
-    for band in bands_list:
-        # every band needs a checkbox before its name
-        is_checked = IntVar()
+    for i in band_order:
+        band = lineup.bands[i]
+        # every band needs a checkbox before its name. the selection of the last session is restored
+        is_checked = IntVar(value=int(selection_journal is not None and selection_journal.is_selected(band)))
+        is_checked.trace_add('write', lambda *args, b=band, v=is_checked: record_band_toggle(b, v))
         band_checkbox = Checkbutton(master=band_frame, onvalue=1, offvalue=0, variable=is_checked)
-        band_checkbox.grid(row=row, column=2*column)
         bands_dict[band] = is_checked
 
         label = band.name
@@ -274,12 +391,23 @@ def open_band_selection_window():
             label += ' (' + get_day_str(band.start) + ')'
 
         band_label = Label(master=band_frame, text=label)
-        band_label.grid(row=row, column=2*column+1)
+        band_widgets[i] = (band_checkbox, band_label)
 
-        row += 1
-        if row > max_rows:
-            row = 0
-            column += 1
+    layout_band_widgets(band_widgets, band_order, band_positions)
+
+    # filter the bands on every key stroke
+    search_index = get_band_search_index()
+    search_text = StringVar(selection_window)
+    search_text.trace_add('write', lambda *args: layout_band_widgets(
+        band_widgets, band_order, band_positions, search_index.search(search_text.get())))
+    search_label = Label(master=search_frame, text="Search band")
+    search_label.grid(row=0, column=0)
+    search_entry = Entry(master=search_frame, textvariable=search_text)
+    search_entry.grid(row=0, column=1)
+
+    # show the current day while selecting. the aliases and walking times may still change while the window is open
+    RunningOrderPreview(preview_frame, render_worker, lineup, settings, stages, bands_dict,
+                        lambda: band_alias_dict, lambda: walking_times)
 
     import_button = Button(master=control_frame, text="Import Personal Running Order Selection",
                            command=lambda: import_selection(lineup, bands_dict))
@@ -294,10 +422,35 @@ def open_band_selection_window():
     clear_button.grid(row=0, column=2)
 
     print_order_button = Button(master=control_frame, text="Print Personal Running Order",
-                                command=lambda:
-                                print_running_order(lineup, settings, stages, bands_dict, band_alias_dict))
+                                command=lambda: create_running_order(bands_dict))
     print_order_button.grid(row=0, column=3)
 
+    ical_button = Button(master=control_frame, text="Export to Calendar",
+                         command=lambda: export_ical(lineup, bands_dict))
+    ical_button.grid(row=0, column=4)
+
+    statistics_button = Button(master=control_frame, text="Statistics",
+                               command=lambda: show_statistics(bands_dict))
+    statistics_button.grid(row=0, column=5)
+
+
+def warm_up_render():
+    # matplotlib is slow to import and on its first use, get that done while the user is still choosing a line-up.
+    # it has to happen in the render worker, as matplotlib keeps the loaded fonts per thread
+    if settings.warm_up_render:
+        render_worker.submit(warm_up_render_stack, settings)
+
+
+def apply_settings(settings_window, *setting_vars):
+    font_sizes = (settings.dpi, settings.band_time_font_size, settings.band_name_font_size,
+                  settings.stage_name_font_size)
+    save_settings(settings, settings_window, *setting_vars)
+
+    # other font sizes need other glyphs
+    if font_sizes != (settings.dpi, settings.band_time_font_size, settings.band_name_font_size,
+                      settings.stage_name_font_size):
+        warm_up_render()
+
 
 def open_settings_window():
     global settings
@@ -328,36 +481,51 @@ def open_settings_window():
     dpi_label = Label(master=settings_window, text="Resolution for printing in dpi")
     dpi_label.grid(row=2, column=1)
 
+    thumbnail_dpi = StringVar(settings_window)
+    thumbnail_dpi.set(settings.thumbnail_dpi)
+    thumbnail_dpi_entry = Entry(master=settings_window, textvariable=thumbnail_dpi)
+    thumbnail_dpi_entry.grid(row=3, column=0)
+    thumbnail_dpi_label = Label(master=settings_window,
+                                text="Resolution of additional .png thumbnails in dpi (0 for none)")
+    thumbnail_dpi_label.grid(row=3, column=1)
+
     # let the user choose the font sizes for bands and stages
     band_time_size = StringVar(settings_window)
     band_time_size.set(settings.band_time_font_size)
     band_time_size_entry = Entry(master=settings_window, textvariable=band_time_size)
-    band_time_size_entry.grid(row=3, column=0)
+    band_time_size_entry.grid(row=4, column=0)
     band_time_size_label = Label(master=settings_window, text="Font size of time in band rectangles")
-    band_time_size_label.grid(row=3, column=1)
+    band_time_size_label.grid(row=4, column=1)
 
     band_name_size = StringVar(settings_window)
     band_name_size.set(settings.band_name_font_size)
     band_name_size_entry = Entry(master=settings_window, textvariable=band_name_size)
-    band_name_size_entry.grid(row=4, column=0)
+    band_name_size_entry.grid(row=5, column=0)
     band_name_size_label = Label(master=settings_window, text="Font size of band name in rectangles")
-    band_name_size_label.grid(row=4, column=1)
+    band_name_size_label.grid(row=5, column=1)
 
     stage_name_size = StringVar(settings_window)
     stage_name_size.set(settings.stage_name_font_size)
     stage_name_size_entry = Entry(master=settings_window, textvariable=stage_name_size)
-    stage_name_size_entry.grid(row=5, column=0)
+    stage_name_size_entry.grid(row=6, column=0)
     stage_name_size_label = Label(master=settings_window, text="Font size of stage names on x axis")
-    stage_name_size_label.grid(row=5, column=1)
+    stage_name_size_label.grid(row=6, column=1)
+
+    warm_up_is_checked = IntVar()
+    warm_up_is_checked.set(settings.warm_up_render)
+    warm_up_checkbox = Checkbutton(master=settings_window, onvalue=1, offvalue=0, variable=warm_up_is_checked)
+    warm_up_checkbox.grid(row=7, column=0)
+    warm_up_label = Label(master=settings_window, text="Prepare printing in the background at start")
+    warm_up_label.grid(row=7, column=1)
 
     save_button = Button(master=settings_window, text="Apply Settings",
-                         command=lambda: save_settings(
-                             settings, settings_window, image_is_checked, pdf_is_checked, dpi,
-                             band_time_size, band_name_size, stage_name_size))
-    save_button.grid(row=6, column=0)
+                         command=lambda: apply_settings(
+                             settings_window, image_is_checked, pdf_is_checked, dpi, thumbnail_dpi,
+                             band_time_size, band_name_size, stage_name_size, warm_up_is_checked))
+    save_button.grid(row=8, column=0)
 
     cancel_button = Button(master=settings_window, text="Discard Changes", command=lambda: settings_window.destroy())
-    cancel_button.grid(row=6, column=1)
+    cancel_button.grid(row=8, column=1)
 
 
 def setup_gui():
@@ -378,8 +546,7 @@ def setup_gui():
     global stages
     create_running_order_button = Button(master=window, text="Create Complete Running Order",
                                          state=DISABLED,
-                                         command=lambda:
-                                         print_running_order(lineup, settings, stages, None, band_alias_dict))
+                                         command=lambda: create_running_order())
     create_running_order_button.grid(row=2, column=0, columnspan=3)
 
     create_personal_running_order_button = Button(master=window, text="Create Personal Running Order",
@@ -387,12 +554,36 @@ def setup_gui():
                                                   command=lambda: open_band_selection_window())
     create_personal_running_order_button.grid(row=3, column=0, columnspan=3)
 
+    create_crew_heatmap_button = Button(master=window, text="Create Crew Heatmap",
+                                        state=DISABLED,
+                                        command=lambda: create_crew_heatmap())
+    create_crew_heatmap_button.grid(row=4, column=0, columnspan=3)
+
+    export_calendars_button = Button(master=window, text="Export Selections to Calendars",
+                                     state=DISABLED,
+                                     command=lambda: export_ical_batch(lineup))
+    export_calendars_button.grid(row=5, column=0, columnspan=3)
+
+    statistics_button = Button(master=window, text="Line-up Statistics",
+                               state=DISABLED,
+                               command=lambda: show_statistics())
+    statistics_button.grid(row=6, column=0, columnspan=3)
+
     parse_button = Button(master=window, text="parse file",
                           command=lambda: execute_parsing(file_path_entry.get(),
                                                           [create_running_order_button,
-                                                           create_personal_running_order_button]))
+                                                           create_personal_running_order_button,
+                                                           create_crew_heatmap_button,
+                                                           export_calendars_button,
+                                                           statistics_button]))
     parse_button.grid(row=1, column=3)
 
+    # print the running order again when the line-up file is edited
+    watch_checkbox = Checkbutton(master=window, onvalue=1, offvalue=0, variable=watch_is_checked)
+    watch_checkbox.grid(row=4, column=3)
+    watch_label = Label(master=window, text="watch line-up file")
+    watch_label.grid(row=4, column=4)
+
     alias_button = Button(master=window, text="alias band names",
                           command=lambda: open_band_alias_window())
     alias_button.grid(row=2, column=3)
@@ -400,6 +591,9 @@ def setup_gui():
     settings_button = Button(master=window, text="Settings", command=lambda: open_settings_window())
     settings_button.grid(row=3, column=3)
 
+    walking_times_button = Button(master=window, text="import walking times", command=lambda: use_walking_times())
+    walking_times_button.grid(row=5, column=3)
+
 
 # prepare the lineup for global access. about every function needs it anyway.
 lineup = None
@@ -409,6 +603,23 @@ stages = None
 settings = Settings
 # allow band aliases for better printing if the names are too long
 band_alias_dict = dict()
+# find bands by their name or alias while typing
+band_search_index = None
+# the minutes it takes to walk between stages, for finding bands that can't be seen one after the other
+walking_times = None
+# keep the line-up up to date with its file and redo the last print on changes
+lineup_watcher = None
+last_print = None
+# the print currently rendered in the background
+current_render = None
+# draws all prints and previews, one after the other
+render_worker = RenderWorker()
+# saves the selection and aliases of the parsed line-up as they are changed
+selection_journal = None
+watch_is_checked = IntVar(value=0)
 setup_gui()
+warm_up_render()
+window.after(1000, watch_lineup_file)
 window.wm_attributes('-topmost', 1)
+window.protocol("WM_DELETE_WINDOW", lambda: close_window())
 window.mainloop()
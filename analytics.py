@@ -0,0 +1,224 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+
+from classes import LineUp
+
+from utils import parse_lineup
+from utils import read_selection_file
+
+
+# a festival day starts at 4 AM and ends at 4 AM of the next day, the same as on the timetable
+DAY_START_MINUTES = 4 * 60
+DAY_MINUTES = 24 * 60
+
+
+@dataclass
+class SlotArrays:
+    """ The slots of a line-up as arrays, one entry per slot in the order of the line-up's band list.
+    Times are minutes since midnight of the festival day, so slots after midnight are later than 24:00 """
+    days: list
+    day_index: np.ndarray
+    stage_index: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+
+
+def get_festival_minutes(times: np.ndarray, days: np.ndarray) -> np.ndarray:
+    minutes = (times - days).astype(np.int64)
+    # like get_hour_value, everything before 4 AM is still part of the day before
+    minutes[minutes < DAY_START_MINUTES] += DAY_MINUTES
+
+    return minutes
+
+
+def get_slot_arrays(lineup: LineUp, bands=None) -> SlotArrays:
+    """ The slots of the given bands, or of the whole line-up """
+    if bands is None:
+        bands = lineup.bands
+    days = sorted(lineup.dates)
+
+    starts = np.array([band.start for band in bands], dtype='datetime64[m]')
+    ends = np.array([band.end for band in bands], dtype='datetime64[m]')
+    start_days = starts.astype('datetime64[D]').astype('datetime64[m]')
+
+    day_index = np.searchsorted(np.array(days, dtype='datetime64[D]'), starts.astype('datetime64[D]'))
+    stage_index = np.array([lineup.stage_ids[band.stage] for band in bands], dtype=np.int64)
+    start = get_festival_minutes(starts, start_days)
+    # an end before the start is on the next day, e.g. 3:30 to 4:30 crosses the start of the festival day
+    end = get_festival_minutes(ends, start_days)
+    end[end < start] += DAY_MINUTES
+
+    return SlotArrays(days, day_index, stage_index, start, end)
+
+
+def get_concurrency(slots: SlotArrays, bin_minutes: int = 15) -> np.ndarray:
+    """ The number of slots playing at the same time in every time bin of every day, as days x bins.
+    A slot counts for every bin it plays in at least partly """
+    num_bins = -(-DAY_MINUTES // bin_minutes)
+    first_bin = (slots.start - DAY_START_MINUTES) // bin_minutes
+    # the first bin the slot doesn't play in anymore
+    last_bin = np.minimum(-(-(slots.end - DAY_START_MINUTES) // bin_minutes), num_bins)
+    last_bin = np.maximum(last_bin, first_bin + 1)
+
+    # +1 where a slot starts and -1 after it ended, summed up over the day gives the slots playing
+    changes = np.zeros((len(slots.days), num_bins + 1), dtype=np.int64)
+    np.add.at(changes, (slots.day_index, first_bin), 1)
+    np.add.at(changes, (slots.day_index, last_bin), -1)
+
+    return np.cumsum(changes, axis=1)[:, :num_bins]
+
+
+def get_concurrency_histogram(concurrency: np.ndarray) -> np.ndarray:
+    """ How many time bins have 0, 1, 2, ... slots playing at the same time.
+    Bins before the first and after the last slot of a day are not counted """
+    playing = concurrency > 0
+    first = np.argmax(playing, axis=1)
+    last = concurrency.shape[1] - np.argmax(playing[:, ::-1], axis=1)
+    bins = np.arange(concurrency.shape[1])
+    is_open = (bins >= first[:, None]) & (bins < last[:, None]) & playing.any(axis=1)[:, None]
+
+    return np.bincount(concurrency[is_open], minlength=1)
+
+
+def get_stage_utilization(slots: SlotArrays, num_stages: int) -> np.ndarray:
+    """ The share of time every stage is playing on every day, as days x stages, between the first
+    start and the last end of the stage on that day. Overlapping slots count only once.
+    Stages without slots on a day have 0 """
+    shape = (len(slots.days), num_stages)
+    first_start = np.full(shape, np.iinfo(np.int64).max)
+    np.minimum.at(first_start, (slots.day_index, slots.stage_index), slots.start)
+    last_end = np.zeros(shape, dtype=np.int64)
+    np.maximum.at(last_end, (slots.day_index, slots.stage_index), slots.end)
+
+    open_minutes = last_end - first_start
+    # the stage is playing all the time it is open, except for its breaks
+    gap_groups, gaps, _ = get_gaps(slots.start, slots.end, slots.day_index * num_stages + slots.stage_index)
+    breaks = np.zeros(len(slots.days) * num_stages, dtype=np.int64)
+    np.add.at(breaks, gap_groups, gaps)
+    played = open_minutes - breaks.reshape(shape)
+
+    utilization = np.zeros(shape)
+    np.divide(played, open_minutes, out=utilization, where=open_minutes > 0)
+
+    return utilization
+
+
+def get_gaps(start: np.ndarray, end: np.ndarray, groups: np.ndarray) -> tuple:
+    """ The breaks between consecutive slots of the same group, with overlapping slots merged.
+    Returns the group of every break, its length, and the index of the slot after it """
+    order = np.lexsort((start, groups))
+    start = start[order]
+    end = end[order]
+    groups = groups[order]
+    if len(order) == 0:
+        return groups, start, order
+
+    # the latest end so far within each group. shifting every group beyond the ends of the one before
+    # keeps the running maximum from reaching over into the next group
+    offset = groups * (int(end.max()) + 1)
+    latest_end = np.maximum.accumulate(end + offset) - offset
+
+    is_same_group = groups[1:] == groups[:-1]
+    gaps = start[1:] - latest_end[:-1]
+    is_gap = is_same_group & (gaps > 0)
+    return groups[1:][is_gap], gaps[is_gap], order[1:][is_gap]
+
+
+def get_longest_gaps(slots: SlotArrays, num_stages: int) -> np.ndarray:
+    """ The longest break in minutes between two slots of every stage on every day, as days x stages """
+    groups = slots.day_index * num_stages + slots.stage_index
+    gap_groups, gaps, _ = get_gaps(slots.start, slots.end, groups)
+
+    longest = np.zeros(len(slots.days) * num_stages, dtype=np.int64)
+    np.maximum.at(longest, gap_groups, gaps)
+
+    return longest.reshape((len(slots.days), num_stages))
+
+
+def get_selection_breaks(slots: SlotArrays) -> tuple:
+    """ The free time between the first and last selected band of every day, and the longest break on every day.
+    Bands overlapping each other count as one long stretch """
+    free_time = np.zeros(len(slots.days), dtype=np.int64)
+    longest_break = np.zeros(len(slots.days), dtype=np.int64)
+
+    gap_days, gaps, _ = get_gaps(slots.start, slots.end, slots.day_index)
+    np.add.at(free_time, gap_days, gaps)
+    np.maximum.at(longest_break, gap_days, gaps)
+
+    return free_time, longest_break
+
+
+def get_minutes_str(minutes) -> str:
+    return '{0}:{1:02d}'.format(int(minutes) // 60, int(minutes) % 60)
+
+
+def get_statistics_report(lineup: LineUp, selection=None, bin_minutes: int = 15) -> str:
+    """ A readable summary of the line-up, and of the selected bands if given """
+    slots = get_slot_arrays(lineup)
+    stage_names = sorted(lineup.stage_ids, key=lambda name: lineup.stage_ids[name])
+    num_stages = len(stage_names)
+
+    lines = []
+    histogram = get_concurrency_histogram(get_concurrency(slots, bin_minutes))
+    lines.append('Bands playing at the same time (share of {0} minute steps):'.format(bin_minutes))
+    total = max(int(histogram.sum()), 1)
+    for count in range(len(histogram)):
+        if histogram[count] > 0:
+            lines.append('  {0}: {1:.0%}'.format(count, histogram[count] / total))
+
+    utilization = get_stage_utilization(slots, num_stages)
+    longest_gaps = get_longest_gaps(slots, num_stages)
+    for day in range(len(slots.days)):
+        lines.append(slots.days[day].strftime('%A, %d.%m.%Y') + ':')
+        for stage in range(num_stages):
+            if utilization[day, stage] == 0:
+                continue
+            lines.append('  {0}: playing {1:.0%}, longest break {2}'.format(
+                stage_names[stage], utilization[day, stage], get_minutes_str(longest_gaps[day, stage])))
+
+    if selection is not None:
+        free_time, longest_break = get_selection_breaks(get_slot_arrays(lineup, selection))
+        lines.append('Your selection:')
+        for day in range(len(slots.days)):
+            lines.append('  {0}: free time {1}, longest break {2}'.format(
+                slots.days[day].strftime('%d.%m.%Y'), get_minutes_str(free_time[day]),
+                get_minutes_str(longest_break[day])))
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show statistics of a line-up')
+    parser.add_argument('lineup', help='the line-up .csv file')
+    parser.add_argument('--selection', help='a .prot selection to show the free time of')
+    parser.add_argument('--bin', type=int, default=15, help='minutes of every time step')
+    args = parser.parse_args()
+
+    statistics_lineup = parse_lineup(args.lineup, interactive=False)
+    if statistics_lineup is None:
+        raise SystemExit(1)
+
+    selected_bands = None
+    if args.selection is not None:
+        selected_keys = set(read_selection_file(args.selection))
+        selected_bands = [band for band in statistics_lineup.bands if (band.name, band.start) in selected_keys]
+
+    print(get_statistics_report(statistics_lineup, selected_bands, args.bin))
@@ -0,0 +1,125 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+import threading
+
+from tkinter import Button
+from tkinter import Label
+from tkinter import Toplevel
+from tkinter import messagebox
+from tkinter import ttk
+
+from classes import RunningOrderPrint
+
+from utils import get_enabled_stage_names
+from utils import get_selected_bands
+from utils import render_running_order
+
+
+class RenderWorker:
+    """ The one thread all running orders and previews are drawn in, one after the other.
+    matplotlib keeps the fonts it loaded for each thread, so drawing always in the same thread loads them only once,
+    and preparing matplotlib in it beforehand makes the first print as fast as the others. """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        self.jobs.put((function, args))
+
+    def run(self):
+        while True:
+            function, args = self.jobs.get()
+            try:
+                function(*args)
+            except Exception as e:
+                # the worker has to keep running for the next print
+                print("Error in the render worker: ", e)
+
+
+class BackgroundRender:
+    """ Renders a running order in the render worker, so the GUI keeps responding.
+    A small window shows the progress and allows canceling. Tk may only be used from the main thread,
+    therefore everything the rendering needs is read from the GUI beforehand, and the worker
+    only sends messages back, which the main loop picks up regularly. """
+
+    def __init__(self, window, render_worker: RenderWorker, running_order_print: RunningOrderPrint, lineup, settings,
+                 stages, days=None):
+        self.window = window
+        self.cancel_event = threading.Event()
+        self.messages = queue.Queue()
+        self.is_running = True
+
+        # read out the gui state while still on the main thread
+        selection = get_selected_bands(lineup, running_order_print.bands_dict)
+        stage_names = get_enabled_stage_names(lineup, stages)
+
+        self.progress_window = Toplevel(window)
+        self.progress_window.title("Printing Running Order")
+        self.progress_window.wm_attributes('-topmost', 1)
+        self.progress_window.protocol("WM_DELETE_WINDOW", lambda: self.cancel())
+
+        self.progress_label = Label(master=self.progress_window, text="Preparing print")
+        self.progress_label.grid(row=0, column=0)
+        self.progress_bar = ttk.Progressbar(master=self.progress_window, length=200, mode='determinate')
+        self.progress_bar.grid(row=1, column=0)
+        cancel_button = Button(master=self.progress_window, text="Cancel", command=lambda: self.cancel())
+        cancel_button.grid(row=2, column=0)
+
+        render_worker.submit(self.run, running_order_print, lineup, settings, selection, stage_names, days)
+        self.window.after(100, self.check_messages)
+
+    def run(self, running_order_print, lineup, settings, selection, stage_names, days):
+        try:
+            is_done = render_running_order(running_order_print, lineup, settings, selection, stage_names, days,
+                                           lambda done, total: self.messages.put(('progress', done, total)),
+                                           self.cancel_event)
+            self.messages.put(('done', is_done))
+        except Exception as e:
+            self.messages.put(('error', e))
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.progress_label['text'] = "Canceling"
+
+    def check_messages(self):
+        # handle everything the worker sent since the last check
+        while not self.messages.empty():
+            message = self.messages.get()
+            if message[0] == 'progress' and not self.cancel_event.is_set():
+                done, total = message[1], message[2]
+                self.progress_bar['maximum'] = max(total, 1)
+                self.progress_bar['value'] = done
+                if done < total:
+                    self.progress_label['text'] = 'Drawing day {0} of {1}'.format(done + 1, total)
+                else:
+                    self.progress_label['text'] = 'Saving'
+            elif message[0] == 'done':
+                self.finish()
+                return
+            elif message[0] == 'error':
+                self.finish()
+                messagebox.showerror('Printing error', 'Could not print the running order:\n' + str(message[1]))
+                return
+
+        self.window.after(100, self.check_messages)
+
+    def finish(self):
+        self.is_running = False
+        self.progress_window.destroy()
@@ -0,0 +1,101 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from classes import Band
+
+
+# the longest parts of a name that are indexed. longer queries are put together out of these
+MAX_GRAM_LENGTH = 3
+
+
+def get_search_text(text: str) -> str:
+    return text.casefold().strip()
+
+
+def get_grams(text: str, length: int) -> set:
+    grams = set()
+    for i in range(len(text) - length + 1):
+        grams.add(text[i:i+length])
+
+    return grams
+
+
+class BandSearchIndex:
+    """ Finds bands by any part of their name or alias while typing.
+    Every part of up to three characters of the names points to the bands containing it. Short queries are
+    looked up directly, longer ones only need to check the bands containing all of their three character parts.
+    If nothing contains the query, bands sharing most of its parts are found instead, which catches typos. """
+
+    def __init__(self, bands: list[Band], band_alias_dict: dict = None):
+        self.bands = bands
+        self.all_ids = set(range(len(bands)))
+        self.texts = []
+        self.grams = {}
+
+        for i in range(len(bands)):
+            text = get_search_text(bands[i].name)
+            if band_alias_dict is not None and bands[i].name in band_alias_dict:
+                # separated by a line break, so no part spans name and alias
+                text += '\n' + get_search_text(band_alias_dict[bands[i].name])
+            self.texts.append(text)
+
+            for length in range(1, MAX_GRAM_LENGTH + 1):
+                for gram in get_grams(text, length):
+                    if gram not in self.grams:
+                        self.grams[gram] = set()
+                    self.grams[gram].add(i)
+
+    def find_containing(self, query: str) -> set:
+        if len(query) <= MAX_GRAM_LENGTH:
+            return self.grams.get(query, set())
+
+        # only bands containing every part of the query can contain the query itself
+        postings = [self.grams.get(gram, set()) for gram in get_grams(query, MAX_GRAM_LENGTH)]
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+
+        return {i for i in candidates if query in self.texts[i]}
+
+    def find_similar(self, query: str) -> set:
+        query_grams = get_grams(query, MAX_GRAM_LENGTH)
+        if len(query_grams) == 0:
+            return set()
+
+        hits = {}
+        for gram in query_grams:
+            for i in self.grams.get(gram, ()):
+                hits[i] = hits.get(i, 0) + 1
+        if len(hits) == 0:
+            return set()
+
+        # a typo changes up to three parts of the query. allow one typo every few characters,
+        # and of all bands within that, take the ones sharing the most parts with the query
+        num_typos = 1 + len(query) // 8
+        min_hits = max(1, len(query_grams) - 3 * num_typos, max(hits.values()))
+        return {i for i, num_hits in hits.items() if num_hits >= min_hits}
+
+    def search(self, query: str) -> set:
+        """ The positions in self.bands of all bands whose name or alias contains the query,
+        or if there are none, of the ones most similar to it. The returned set must not be changed """
+        query = get_search_text(query)
+        if query == '':
+            return self.all_ids
+
+        found = self.find_containing(query)
+        if len(found) == 0:
+            found = self.find_similar(query)
+
+        return found
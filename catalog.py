@@ -0,0 +1,123 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import bisect
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+
+from classes import Band
+from classes import LineUp
+
+from utils import parse_lineup
+
+
+@dataclass
+class Catalog:
+    """ The line-ups of many festivals, with an index of every band across all of them """
+    # the line-up of every festival, by the name of its file
+    festivals: dict[str, LineUp] = field(default_factory=dict)
+    # the slots of every band as (festival, band), by the lower case band name
+    band_index: dict[str, list[tuple[str, Band]]] = field(default_factory=dict)
+    # first day, last day and name of every festival, sorted by the first day
+    festival_days: list[tuple[datetime, datetime, str]] = field(default_factory=list)
+
+    def add_festival(self, festival: str, lineup: LineUp):
+        self.festivals[festival] = lineup
+
+        for band in lineup.bands:
+            key = band.name.lower()
+            if key not in self.band_index:
+                self.band_index[key] = []
+            self.band_index[key].append((festival, band))
+
+        # bands playing after midnight are dated on the previous day, so the days of the line-up are the festival days
+        if len(lineup.dates) > 0:
+            bisect.insort(self.festival_days, (min(lineup.dates), max(lineup.dates), festival))
+
+    def get_band_slots(self, band_name: str) -> list[tuple[str, Band]]:
+        return self.band_index.get(band_name.lower(), [])
+
+    def get_overlapping_festivals(self, first_day: datetime, last_day: datetime) -> list[str]:
+        """ All festivals with at least one day between first_day and last_day (both included) """
+        # festivals starting after last_day can't overlap, so only the ones before have to be checked
+        end = bisect.bisect_right(self.festival_days, (last_day, datetime.max, ''))
+
+        festivals = []
+        for festival_first_day, festival_last_day, festival in self.festival_days[:end]:
+            if festival_last_day >= first_day:
+                festivals.append(festival)
+
+        return festivals
+
+
+def get_lineup_files(directory) -> list:
+    file_paths = []
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.lower().endswith('.csv'):
+            file_paths.append(os.path.join(directory, file_name))
+
+    return file_paths
+
+
+def parse_lineup_quietly(file_path) -> LineUp:
+    # the workers can't show message boxes, errors are printed instead
+    return parse_lineup(file_path, interactive=False)
+
+
+def load_catalog(directory, max_workers=None) -> Catalog:
+    """ Parse every line-up .csv file of a directory in parallel processes and merge them into one catalog """
+    file_paths = get_lineup_files(directory)
+
+    catalog = Catalog()
+    # parsing is bound by the cpu, so threads would only take turns
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for file_path, lineup in zip(file_paths, executor.map(parse_lineup_quietly, file_paths)):
+            if lineup is None:
+                print("Skipping ", file_path)
+                continue
+
+            festival = os.path.splitext(os.path.basename(file_path))[0]
+            catalog.add_festival(festival, lineup)
+
+    return catalog
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search a directory of line-up .csv files')
+    parser.add_argument('directory', help='the directory containing the line-up .csv files')
+    parser.add_argument('--band', help='list every slot of this band')
+    parser.add_argument('--overlap', nargs=2, metavar=('FIRST_DAY', 'LAST_DAY'),
+                        help='list every festival playing between these days (dd.mm.yyyy)')
+    parser.add_argument('--workers', type=int, default=None, help='number of parallel parsing processes')
+    args = parser.parse_args()
+
+    festival_catalog = load_catalog(args.directory, args.workers)
+    print('{0} festivals, {1} bands'.format(len(festival_catalog.festivals), len(festival_catalog.band_index)))
+
+    if args.band is not None:
+        for festival_name, slot in festival_catalog.get_band_slots(args.band):
+            print('{0}: {1} {2}-{3} {4}'.format(festival_name, slot.start.strftime('%d.%m.%Y'),
+                                                slot.start.strftime('%H:%M'), slot.end.strftime('%H:%M'), slot.stage))
+
+    if args.overlap is not None:
+        overlap_first_day = datetime.strptime(args.overlap[0], '%d.%m.%Y')
+        overlap_last_day = datetime.strptime(args.overlap[1], '%d.%m.%Y')
+        for festival_name in festival_catalog.get_overlapping_festivals(overlap_first_day, overlap_last_day):
+            print(festival_name)
@@ -18,6 +18,8 @@ import string
 import enum
 import datetime
 from dataclasses import dataclass
+from dataclasses import field
+import numpy as np
 from tkinter import Checkbutton
 from tkinter import Label
 from tkinter import IntVar
@@ -51,6 +53,18 @@ class LineUp:
     stages: list[string]
     dates: dict[datetime, list[string]]
     bands: list[Band]
+    # the column of every stage, in the order the stages are listed in the file
+    stage_ids: dict[string, int] = field(default_factory=dict)
+    # the bands of every day, partitioned by the stage they play on
+    stage_slots: dict[datetime, dict[string, list[Band]]] = field(default_factory=dict)
+
+    def get_stage_columns(self, stage_names) -> dict[string, int]:
+        """ The column of every given stage, if only the given stages are printed """
+        columns = {}
+        for stage in sorted(stage_names, key=lambda name: self.stage_ids[name]):
+            columns[stage] = len(columns)
+
+        return columns
 
     def contains_band(self, band_name) -> bool:
         for band in self.bands:
@@ -74,14 +88,56 @@ class LineUp:
         return None
 
 
+@dataclass
+class CrewSelection:
+    """ The selections of a whole crew aggregated over one line-up.
+    Counts are indexed by the band ordinals, i.e. the position of a band in the line-up's band list."""
+    band_ordinals: dict
+    counts: np.ndarray
+    clash_counts: np.ndarray
+    num_selections: int
+
+    def get_count(self, band: Band) -> int:
+        # bands that were added to the line-up after aggregating were picked by no one
+        key = (band.name, band.start)
+        if key not in self.band_ordinals:
+            return 0
+        return int(self.counts[self.band_ordinals[key]])
+
+    def get_clash_count(self, band: Band) -> int:
+        key = (band.name, band.start)
+        if key not in self.band_ordinals:
+            return 0
+        return int(self.clash_counts[self.band_ordinals[key]])
+
+
+@dataclass
+class RunningOrderPrint:
+    """ A running order that was printed, with everything needed to print it again to the same path """
+    save_path: string
+    bands_dict: dict = None
+    band_alias_dict: dict = None
+    crew_selection: CrewSelection = None
+    # minutes it takes to walk between two stages, by (from stage, to stage)
+    walking_times: dict = None
+    # the drawn figure of every day
+    figures: dict = field(default_factory=dict)
+    # the selection, aliases, stages and settings the figures were drawn with, they are only reused with the same
+    figures_state: tuple = None
+
+
 @dataclass
 class Settings:
     save_as_image: int = 0
     save_as_pdf: int = 1
     dpi: int = 200
+    # resolution of additional small .png images, 0 to create none
+    thumbnail_dpi: int = 0
     band_time_font_size: int = 7
     band_name_font_size: int = 9
     stage_name_font_size: int = 10
+    # prepare matplotlib in the background at start, so the first print is not slower than the others
+    warm_up_render: int = 1
 
 
 @dataclass
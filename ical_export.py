@@ -0,0 +1,212 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import hashlib
+import os
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from tkinter import filedialog
+
+from classes import Band
+from classes import LineUp
+
+from utils import get_selected_bands
+from utils import parse_lineup
+from utils import read_selection_file
+from utils import save_file_as_browser
+
+
+def get_real_times(band: Band) -> tuple:
+    """ The actual start and end of a band. In the line-up, bands playing after midnight keep the date of
+    the festival day they belong to, just like on the timetable everything before 4 AM belongs to the day before """
+    start = band.start
+    end = band.end
+    if start.hour < 4:
+        start += timedelta(days=1)
+    if end.hour < 4:
+        end += timedelta(days=1)
+    if end < start:
+        # e.g. 23:40 to 0:25 is already covered above, anything else still ending before it starts ends a day later
+        end += timedelta(days=1)
+
+    return start, end
+
+
+def escape_text(text: str) -> str:
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold_line(line: str) -> str:
+    # lines must not be longer than 75 octets, longer ones continue on the next line after a space
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    parts = []
+    part = ''
+    part_length = 0
+    max_length = 75
+    for char in line:
+        char_length = len(char.encode('utf-8'))
+        if part_length + char_length > max_length:
+            parts.append(part)
+            part = ''
+            part_length = 0
+            # the space starting a continued line counts as well
+            max_length = 74
+        part += char
+        part_length += char_length
+    parts.append(part)
+
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def get_event(band: Band, time_stamp: str) -> str:
+    start, end = get_real_times(band)
+    uid = hashlib.sha1((band.name + band.start.isoformat() + band.stage).encode('utf-8')).hexdigest()
+
+    # the times have no time zone, they are the local times of the festival
+    lines = ['BEGIN:VEVENT',
+             'UID:' + uid + '@personal-running-order',
+             'DTSTAMP:' + time_stamp,
+             'DTSTART:' + start.strftime('%Y%m%dT%H%M%S'),
+             'DTEND:' + end.strftime('%Y%m%dT%H%M%S'),
+             'SUMMARY:' + escape_text(band.name),
+             'LOCATION:' + escape_text(band.stage),
+             'END:VEVENT']
+
+    return ''.join(fold_line(line) for line in lines)
+
+
+CALENDAR_HEADER = 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Personal Running Order Tool//EN\r\n'
+CALENDAR_FOOTER = 'END:VCALENDAR\r\n'
+
+
+def get_time_stamp() -> str:
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def write_ical(file_path, bands):
+    """ Write one calendar event for every band """
+    time_stamp = get_time_stamp()
+    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(CALENDAR_HEADER)
+        for band in bands:
+            f.write(get_event(band, time_stamp))
+        f.write(CALENDAR_FOOTER)
+
+
+def get_calendar_names(selection_files) -> list[str]:
+    """ The name of the calendar of every selection. Selections with the same name from different
+    directories are numbered, e.g. crew.prot and crew.prot become crew and crew-2 """
+    names = [os.path.splitext(os.path.basename(selection_file))[0] for selection_file in selection_files]
+    # compared without case, as most file systems of phones and desktops don't tell crew and Crew apart
+    taken = {name.casefold() for name in names}
+    used = set()
+    calendar_names = []
+    for name in names:
+        calendar_name = name
+        number = 1
+        while calendar_name.casefold() in used or (number > 1 and calendar_name.casefold() in taken):
+            number += 1
+            calendar_name = name + '-' + str(number)
+        used.add(calendar_name.casefold())
+        calendar_names.append(calendar_name)
+
+    return calendar_names
+
+
+def write_ical_batch(lineup: LineUp, selection_files, out_dir) -> list:
+    """ Write a calendar for every .prot selection into out_dir, named like the selection.
+    Selections with the same name get a number, so no calendar overwrites another one.
+    All calendars are written at once in one pass over the line-up, the line-up is not read again per selection.
+    Returns the paths of the written calendars """
+    # which selections picked a band, by (band name, start)
+    selected_by = {}
+    for i in range(len(selection_files)):
+        for band in read_selection_file(selection_files[i]):
+            if band not in selected_by:
+                selected_by[band] = []
+            selected_by[band].append(i)
+
+    time_stamp = get_time_stamp()
+    file_paths = []
+    files = []
+    try:
+        for name in get_calendar_names(selection_files):
+            file_path = os.path.join(out_dir, name + '.ics')
+            f = open(file_path, 'w', encoding='utf-8', newline='')
+            files.append(f)
+            file_paths.append(file_path)
+            f.write(CALENDAR_HEADER)
+
+        for band in lineup.bands:
+            selections = selected_by.get((band.name, band.start))
+            if selections is None:
+                continue
+            event = get_event(band, time_stamp)
+            for i in selections:
+                files[i].write(event)
+
+        for f in files:
+            f.write(CALENDAR_FOOTER)
+    finally:
+        for f in files:
+            f.close()
+
+    return file_paths
+
+
+def export_ical(lineup: LineUp, bands_dict: dict):
+    file_types = (("iCalendar file", "*.ics"),)
+    file_path = save_file_as_browser(file_types)
+    if file_path == "" or file_path == ".ics":
+        return
+
+    write_ical(file_path, get_selected_bands(lineup, bands_dict))
+
+
+def export_ical_batch(lineup: LineUp):
+    file_types = (("Personal Running Order text file", "*.prot*"), ("Text files", "*.txt*"), ("All files", "*.*"))
+    selection_files = filedialog.askopenfilenames(initialdir=os.getcwd(),
+                                                  title="Select the selections to export",
+                                                  filetypes=file_types)
+    if len(selection_files) == 0:
+        return
+
+    out_dir = filedialog.askdirectory(initialdir=os.path.dirname(selection_files[0]),
+                                      title="Select the directory for the calendar files")
+    if out_dir == "" or out_dir == ():
+        return
+
+    write_ical_batch(lineup, list(selection_files), out_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export .prot selections as iCalendar files')
+    parser.add_argument('lineup', help='the line-up .csv file')
+    parser.add_argument('selections', nargs='+', help='the .prot selections to export')
+    parser.add_argument('--out', default='.', help='the directory for the .ics files')
+    args = parser.parse_args()
+
+    ical_lineup = parse_lineup(args.lineup, interactive=False)
+    if ical_lineup is None:
+        raise SystemExit(1)
+    for path in write_ical_batch(ical_lineup, args.selections, args.out):
+        print('saving {0}'.format(path))
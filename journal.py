@@ -0,0 +1,180 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from classes import Band
+
+
+# where the sessions of all line-ups are kept
+JOURNAL_DIRECTORY = os.path.join(os.path.expanduser('~'), '.personal_running_order')
+# collect changes for this long before writing them to disk together
+FLUSH_INTERVAL = 1.0
+# write a new snapshot once the journal holds this many changes
+COMPACT_AFTER = 1000
+
+
+def apply_record(record: dict, selection: set, aliases: dict):
+    if record['op'] == 'select':
+        selection.add((record['name'], datetime.fromisoformat(record['start'])))
+    elif record['op'] == 'deselect':
+        selection.discard((record['name'], datetime.fromisoformat(record['start'])))
+    elif record['op'] == 'alias':
+        aliases[record['name']] = record['alias']
+    elif record['op'] == 'unalias':
+        aliases.pop(record['name'], None)
+
+
+def get_snapshot(selection: set, aliases: dict) -> dict:
+    return {'selection': [[name, start.isoformat()] for name, start in sorted(selection)],
+            'aliases': aliases}
+
+
+class SelectionJournal:
+    """ Saves the selection and the band aliases of a line-up automatically, so they are back after a restart.
+    Every change is appended to a journal file as one small record, which costs the same however large the
+    selection is. The records are written and synced to disk by a worker thread in batches.
+    Once the journal grew long, it is replaced by a snapshot of the whole state.
+    Every line-up file has its own journal, named by a hash of its path. """
+
+    def __init__(self, lineup_path, directory=JOURNAL_DIRECTORY):
+        os.makedirs(directory, exist_ok=True)
+        name = hashlib.sha1(os.path.abspath(lineup_path).encode('utf-8')).hexdigest()
+        self.journal_path = os.path.join(directory, name + '.journal')
+        self.snapshot_path = os.path.join(directory, name + '.snapshot')
+
+        # the state as (band name, start) of the selected bands and the alias of every band name
+        self.selection = set()
+        self.aliases = {}
+        num_records = self.load()
+
+        self.records = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       args=(set(self.selection), dict(self.aliases), num_records))
+        self.thread.start()
+
+    def load(self) -> int:
+        """ Read the snapshot and replay the journal on top of it. Returns the number of records in the journal """
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            try:
+                self.selection = {(name, datetime.fromisoformat(start)) for name, start in snapshot['selection']}
+                self.aliases = dict(snapshot['aliases'])
+            except (TypeError, KeyError) as e:
+                raise ValueError('Invalid snapshot ' + self.snapshot_path + ': ' + str(e))
+
+        num_records = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                content = f.read()
+            valid_length = 0
+            for line in content.splitlines(keepends=True):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete record')
+                    record = json.loads(line.decode('utf-8'))
+                    apply_record(record, self.selection, self.aliases)
+                except (ValueError, TypeError, KeyError):
+                    # the program was ended while writing the last record, or the journal was damaged otherwise.
+                    # cut it off there, otherwise the next records would be appended after it
+                    os.truncate(self.journal_path, valid_length)
+                    break
+                num_records += 1
+                valid_length += len(line)
+
+        return num_records
+
+    def is_selected(self, band: Band) -> bool:
+        return (band.name, band.start) in self.selection
+
+    def record_toggle(self, band: Band, is_selected: bool):
+        key = (band.name, band.start)
+        if is_selected == (key in self.selection):
+            return
+
+        if is_selected:
+            self.selection.add(key)
+        else:
+            self.selection.discard(key)
+        self.records.put({'op': 'select' if is_selected else 'deselect',
+                          'name': band.name, 'start': band.start.isoformat()})
+
+    def record_aliases(self, band_alias_dict: dict):
+        # only the aliases that changed are written
+        for name, alias in band_alias_dict.items():
+            if self.aliases.get(name) != alias:
+                self.records.put({'op': 'alias', 'name': name, 'alias': alias})
+        for name in self.aliases:
+            if name not in band_alias_dict:
+                self.records.put({'op': 'unalias', 'name': name})
+        self.aliases = dict(band_alias_dict)
+
+    def run(self, selection, aliases, num_records):
+        # the worker keeps its own copy of the state, to write snapshots without touching the one of the GUI
+        is_closing = False
+        while not is_closing:
+            # wait for the first change, then collect everything coming in shortly after it
+            batch = []
+            record = self.records.get()
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while record is not None:
+                batch.append(record)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self.records.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            is_closing = record is None
+            if len(batch) == 0:
+                continue
+
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                for record in batch:
+                    f.write(json.dumps(record) + '\n')
+                    apply_record(record, selection, aliases)
+                f.flush()
+                os.fsync(f.fileno())
+
+            num_records += len(batch)
+            if num_records >= COMPACT_AFTER:
+                self.compact(selection, aliases)
+                num_records = 0
+
+    def compact(self, selection, aliases):
+        # replace the snapshot at once, so there is always a complete one. the journal is only emptied
+        # afterwards, replaying it once more on the new snapshot does no harm
+        temp_path = self.snapshot_path + '.part'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(get_snapshot(selection, aliases), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        open(self.journal_path, 'w').close()
+
+    def close(self):
+        """ Write everything that is still waiting """
+        self.records.put(None)
+        self.thread.join()
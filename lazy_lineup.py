@@ -0,0 +1,222 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import mmap
+import os
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+
+from classes import Band
+from classes import LineUp
+from classes import RunningOrderPrint
+from classes import Settings
+
+from utils import parse_lineup_line
+from utils import render_running_order
+
+
+def is_lineup_data_bytes(line: bytes) -> bool:
+    # the same as is_lineup_data_line, for lines that are not decoded yet
+    return not (line.startswith(b'Band') or line.startswith(b'#') or line.strip(b'\r\n') == b'')
+
+
+class LazyStageSlots(Mapping):
+    """ The bands of one day by stage, every stage is only read from the file when it is asked for """
+
+    def __init__(self, lineup, day):
+        self.lineup = lineup
+        self.day = day
+        self.slots = {}
+
+    def __getitem__(self, stage) -> list[Band]:
+        if stage not in self.slots:
+            offsets, line_numbers = self.lineup.index[self.day][stage]
+            self.slots[stage] = [self.lineup.get_band(offset, line_number)
+                                 for offset, line_number in zip(offsets, line_numbers)]
+        return self.slots[stage]
+
+    def __iter__(self):
+        return iter(self.lineup.index[self.day])
+
+    def __len__(self):
+        return len(self.lineup.index[self.day])
+
+
+class LazyDays(Mapping):
+    """ The bands of every day in the order of the file, every day is only read when it is asked for """
+
+    def __init__(self, lineup):
+        self.lineup = lineup
+        self.bands = {}
+
+    def __getitem__(self, day) -> list[Band]:
+        if day not in self.bands:
+            rows = []
+            for offsets, line_numbers in self.lineup.index[day].values():
+                rows += zip(offsets, line_numbers)
+            self.bands[day] = [self.lineup.get_band(offset, line_number) for offset, line_number in sorted(rows)]
+        return self.bands[day]
+
+    def __iter__(self):
+        return iter(self.lineup.index)
+
+    def __len__(self):
+        return len(self.lineup.index)
+
+
+class LazyLineUp:
+    """ A read-only line-up for very large files. The file is mapped into memory and read once, only to note
+    where the lines of every day and stage start. A band is only parsed when its day or stage is used,
+    so e.g. printing one day reads only the lines of that day.
+    It can be used in place of a LineUp: stages, stage_ids, dates, stage_slots and bands work the same way.
+    Using bands parses the whole file. """
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'rb')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            # an empty file can't be mapped
+            self.file.close()
+            raise ValueError('The line-up file ' + str(file_path) + ' is empty')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # the parsed bands by the offset of their line, shared by all views on the line-up
+        self.parsed_bands = {}
+        self.all_bands = None
+
+        self.stages = []
+        self.stage_ids = {}
+        # the offsets and line numbers of the lines of every day and stage
+        self.index = {}
+        self.build_index()
+
+        self.dates = LazyDays(self)
+        self.stage_slots = {}
+        for day in self.index:
+            self.stage_slots[day] = LazyStageSlots(self, day)
+
+    def build_index(self):
+        # the offsets by the raw date and stage. the lines are only split, nothing is decoded yet
+        rows = {}
+        offset = 0
+        line_number = 0
+        for line in iter(self.map.readline, b''):
+            line_number += 1
+            if is_lineup_data_bytes(line):
+                fields = line.split(b',', 5)
+                if len(fields) < 5:
+                    raise ValueError('Could not parse line ' + str(line_number) + ': ' + repr(line))
+
+                key = (fields[1], fields[4].rstrip(b'\r\n'))
+                if key not in rows:
+                    rows[key] = (array('q'), array('q'))
+                rows[key][0].append(offset)
+                rows[key][1].append(line_number)
+            offset += len(line)
+
+        # stages and days are only decoded once each, not once per line
+        days = {}
+        for (date, stage), row in rows.items():
+            if date not in days:
+                try:
+                    days[date] = datetime.strptime(date.decode('utf-8'), '%d.%m.%Y')
+                except ValueError:
+                    raise ValueError('Could not parse date on line ' + str(row[1][0]))
+            day = days[date]
+            stage_name = stage.decode('utf-8')
+            if day not in self.index:
+                self.index[day] = {}
+
+            if stage_name not in self.index[day]:
+                self.index[day][stage_name] = row
+            else:
+                # the same day written differently, e.g. 17.08.2022 and 17.8.2022. keep the lines in file order
+                offsets, line_numbers = self.index[day][stage_name]
+                merged = sorted(zip(offsets + row[0], line_numbers + row[1]))
+                self.index[day][stage_name] = (array('q', [offset for offset, _ in merged]),
+                                               array('q', [line_number for _, line_number in merged]))
+
+        # the stages in the order they first appear in the file, like in parse_lineup
+        first_offsets = {}
+        for day_rows in self.index.values():
+            for stage, (offsets, line_numbers) in day_rows.items():
+                first_offsets[stage] = min(first_offsets.get(stage, offsets[0]), offsets[0])
+        self.stages = sorted(first_offsets, key=lambda name: first_offsets[name])
+        for stage in self.stages:
+            self.stage_ids[stage] = len(self.stage_ids)
+
+    def get_band(self, offset, line_number) -> Band:
+        if offset not in self.parsed_bands:
+            end = self.map.find(b'\n', offset)
+            if end == -1:
+                end = len(self.map)
+            line = self.map[offset:end].decode('utf-8').rstrip('\r')
+            band = parse_lineup_line(line, line_number, interactive=False)
+            if band is None:
+                raise ValueError('Could not parse line ' + str(line_number) + ': ' + line)
+            self.parsed_bands[offset] = band
+        return self.parsed_bands[offset]
+
+    @property
+    def bands(self) -> list[Band]:
+        if self.all_bands is None:
+            rows = []
+            for day_rows in self.index.values():
+                for offsets, line_numbers in day_rows.values():
+                    rows += zip(offsets, line_numbers)
+            self.all_bands = [self.get_band(offset, line_number) for offset, line_number in sorted(rows)]
+        return self.all_bands
+
+    def get_num_slots(self, day, stage) -> int:
+        """ The number of bands on a stage on a day, without reading them """
+        if stage not in self.index.get(day, {}):
+            return 0
+        return len(self.index[day][stage][0])
+
+    get_stage_columns = LineUp.get_stage_columns
+    contains_band = LineUp.contains_band
+    get_full_info = LineUp.get_full_info
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Look into a large line-up file without parsing all of it')
+    parser.add_argument('lineup', help='the line-up .csv file')
+    parser.add_argument('--day', help='print the complete running order of this day (dd.mm.yyyy) as .png')
+    parser.add_argument('--out', default='running_order', help='the path of the .png, without the day')
+    args = parser.parse_args()
+
+    with LazyLineUp(args.lineup) as lazy_lineup:
+        if args.day is None:
+            for lineup_day in sorted(lazy_lineup.dates):
+                counts = ['{0}: {1}'.format(stage, lazy_lineup.get_num_slots(lineup_day, stage))
+                          for stage in lazy_lineup.stages if lazy_lineup.get_num_slots(lineup_day, stage) > 0]
+                print(lineup_day.strftime('%d.%m.%Y') + ' - ' + ', '.join(counts))
+        else:
+            print_day = datetime.strptime(args.day, '%d.%m.%Y')
+            if print_day not in lazy_lineup.dates:
+                raise SystemExit('There are no bands on ' + args.day)
+            render_running_order(RunningOrderPrint(args.out), lazy_lineup, Settings(save_as_image=1, save_as_pdf=0),
+                                 [], list(lazy_lineup.stages), {print_day})
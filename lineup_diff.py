@@ -0,0 +1,246 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+from dataclasses import dataclass
+from dataclasses import field
+
+from classes import Band
+from classes import LineUp
+
+from utils import get_time_clashing_bands
+from utils import get_timeless_date
+from utils import parse_lineup
+from utils import read_selection_file
+
+
+@dataclass
+class SlotChange:
+    """ A slot of the old line-up and what became of it in the new one """
+    old: Band = None
+    new: Band = None
+
+
+@dataclass
+class LineUpDiff:
+    """ All changes between two versions of a line-up, and how they affect a selection """
+    added: list[SlotChange] = field(default_factory=list)
+    removed: list[SlotChange] = field(default_factory=list)
+    moved: list[SlotChange] = field(default_factory=list)
+    stage_changed: list[SlotChange] = field(default_factory=list)
+    affected_days: set = field(default_factory=set)
+    # the changes to bands in the selection
+    selection_changes: list[SlotChange] = field(default_factory=list)
+    # selected bands that clash in the new line-up, but did not clash in the old one
+    new_clashes: list[Band] = field(default_factory=list)
+
+
+def get_slots_by_key(bands, key) -> dict:
+    slots = {}
+    for band in bands:
+        k = key(band)
+        if k not in slots:
+            slots[k] = []
+        slots[k].append(band)
+
+    return slots
+
+
+def join_slots(old_bands, new_bands, key) -> tuple:
+    """ Pair up the slots of both line-ups with the same key.
+    Returns the pairs, and the slots of each line-up without a partner """
+    new_slots = get_slots_by_key(new_bands, key)
+
+    pairs = []
+    old_unmatched = []
+    for band in old_bands:
+        candidates = new_slots.get(key(band))
+        if candidates:
+            # a band playing twice under the same key is paired in the order of the file
+            pairs.append((band, candidates.pop(0)))
+        else:
+            old_unmatched.append(band)
+
+    new_unmatched = []
+    for candidates in new_slots.values():
+        new_unmatched += candidates
+
+    return pairs, old_unmatched, new_unmatched
+
+
+def diff_lineups(old_lineup: LineUp, new_lineup: LineUp, selection=None) -> LineUpDiff:
+    """ Compare two versions of a line-up.
+    The slots are joined on band name and day, slots that changed the day are then joined on band name only.
+    If a selection of (band name, start) tuples is given, the clashes of the selection are checked again
+    on the affected days of the new line-up. """
+    diff = LineUpDiff()
+
+    pairs, old_unmatched, new_unmatched = join_slots(old_lineup.bands, new_lineup.bands,
+                                                     lambda band: (band.name, get_timeless_date(band.start)))
+    # a band that changed the day is still the same slot, just moved
+    day_pairs, old_unmatched, new_unmatched = join_slots(old_unmatched, new_unmatched, lambda band: band.name)
+    pairs += day_pairs
+
+    changes = []
+    for old, new in pairs:
+        change = SlotChange(old, new)
+        is_changed = False
+        if old.start != new.start or old.end != new.end:
+            diff.moved.append(change)
+            is_changed = True
+        if old.stage != new.stage:
+            diff.stage_changed.append(change)
+            is_changed = True
+        if is_changed:
+            changes.append(change)
+
+    for band in old_unmatched:
+        change = SlotChange(band, None)
+        diff.removed.append(change)
+        changes.append(change)
+    for band in new_unmatched:
+        change = SlotChange(None, band)
+        diff.added.append(change)
+        changes.append(change)
+
+    for change in changes:
+        if change.old is not None:
+            diff.affected_days.add(get_timeless_date(change.old.start))
+        if change.new is not None:
+            diff.affected_days.add(get_timeless_date(change.new.start))
+
+    if selection is None:
+        return diff
+
+    selection = set(selection)
+    for change in changes:
+        if change.old is not None and (change.old.name, change.old.start) in selection:
+            diff.selection_changes.append(change)
+
+    # follow the selected bands into the new line-up, but only those on affected days can clash differently
+    new_of_old = {}
+    for old, new in pairs:
+        new_of_old[(old.name, old.start)] = new
+
+    old_selection = []
+    new_selection = []
+    for band in old_lineup.bands:
+        if (band.name, band.start) not in selection or (band.name, band.start) not in new_of_old:
+            continue
+        new = new_of_old[(band.name, band.start)]
+        if get_timeless_date(band.start) in diff.affected_days:
+            old_selection.append(band)
+        if get_timeless_date(new.start) in diff.affected_days:
+            new_selection.append(new)
+
+    # compare the clashes by the slots of the new line-up
+    old_clashes = set()
+    for band in get_time_clashing_bands(old_selection, old_lineup):
+        old_clashes.add(id(new_of_old[(band.name, band.start)]))
+    for band in get_time_clashing_bands(new_selection, new_lineup):
+        if id(band) not in old_clashes:
+            diff.new_clashes.append(band)
+
+    return diff
+
+
+def get_slot_info(band: Band) -> dict:
+    if band is None:
+        return None
+
+    return {'name': band.name, 'stage': band.stage,
+            'start': band.start.isoformat(), 'end': band.end.isoformat()}
+
+
+def get_diff_report(diff: LineUpDiff) -> dict:
+    """ The diff as plain data, e.g. to be written as json """
+    report = {}
+    report['added'] = [get_slot_info(change.new) for change in diff.added]
+    report['removed'] = [get_slot_info(change.old) for change in diff.removed]
+    report['moved'] = [{'old': get_slot_info(change.old), 'new': get_slot_info(change.new)}
+                       for change in diff.moved]
+    report['stage_changed'] = [{'old': get_slot_info(change.old), 'new': get_slot_info(change.new)}
+                               for change in diff.stage_changed]
+    report['affected_days'] = [day.date().isoformat() for day in sorted(diff.affected_days)]
+    report['selection_changes'] = [{'old': get_slot_info(change.old), 'new': get_slot_info(change.new)}
+                                   for change in diff.selection_changes]
+    report['new_clashes'] = [get_slot_info(band) for band in diff.new_clashes]
+
+    return report
+
+
+def write_diff_report(diff: LineUpDiff, file_path):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(get_diff_report(diff), f, indent=2)
+
+
+def get_slot_str(band: Band) -> str:
+    return '{0} ({1}, {2}-{3}, {4})'.format(band.name, band.start.strftime('%d.%m.%Y'),
+                                             band.start.strftime('%H:%M'), band.end.strftime('%H:%M'), band.stage)
+
+
+def print_diff_summary(diff: LineUpDiff):
+    print('{0} added, {1} removed, {2} moved, {3} stage changed'.format(
+        len(diff.added), len(diff.removed), len(diff.moved), len(diff.stage_changed)))
+
+    for change in diff.added:
+        print('  + ' + get_slot_str(change.new))
+    for change in diff.removed:
+        print('  - ' + get_slot_str(change.old))
+    # a slot that moved to another time and stage is listed in both, but only needs to be shown once
+    shown = set()
+    for change in diff.moved + diff.stage_changed:
+        if id(change) in shown:
+            continue
+        shown.add(id(change))
+        print('  ~ ' + get_slot_str(change.old) + ' -> ' + get_slot_str(change.new))
+
+    if len(diff.selection_changes) > 0:
+        print('Changes to your selection:')
+        for change in diff.selection_changes:
+            if change.new is None:
+                print('  - ' + get_slot_str(change.old))
+            else:
+                print('  ~ ' + get_slot_str(change.old) + ' -> ' + get_slot_str(change.new))
+
+    if len(diff.new_clashes) > 0:
+        print('New clashes in your selection:')
+        for band in diff.new_clashes:
+            print('  ! ' + get_slot_str(band))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the changes between two versions of a line-up')
+    parser.add_argument('old', help='the old line-up .csv file')
+    parser.add_argument('new', help='the new line-up .csv file')
+    parser.add_argument('--selection', help='a .prot selection made for the old line-up')
+    parser.add_argument('--report', help='write the changes as json to this file')
+    args = parser.parse_args()
+
+    old_lineup = parse_lineup(args.old, interactive=False)
+    new_lineup = parse_lineup(args.new, interactive=False)
+    if old_lineup is None or new_lineup is None:
+        raise SystemExit(1)
+
+    selection = None
+    if args.selection is not None:
+        selection = read_selection_file(args.selection)
+
+    lineup_diff = diff_lineups(old_lineup, new_lineup, selection)
+    print_diff_summary(lineup_diff)
+    if args.report is not None:
+        write_diff_report(lineup_diff, args.report)
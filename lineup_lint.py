@@ -0,0 +1,186 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import re
+from dataclasses import dataclass
+from dataclasses import field
+
+from classes import Band
+from classes import LineUp
+
+from utils import get_hour_value
+from utils import parse_lineup
+
+
+@dataclass
+class LineUpLint:
+    """ Everything in a line-up that is most likely a mistake in the file """
+    # groups of stage names so similar that they are probably meant to be the same stage
+    similar_stages: list[list[str]] = field(default_factory=list)
+    # slots on the same stage and day playing at the same time, as (earlier slot, later slot)
+    overlaps: list[tuple[Band, Band]] = field(default_factory=list)
+    # slots ending when they start. a slot ending before it starts ends on the next day
+    invalid_times: list[Band] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return len(self.similar_stages) == 0 and len(self.overlaps) == 0 and len(self.invalid_times) == 0
+
+
+def get_normalized_stage_name(name: str) -> str:
+    # "T-Stage", "T Stage" and "t-stage" are all the same stage
+    return re.sub(r'[\s\-_]', '', name.casefold())
+
+
+def get_edit_distance(a: str, b: str, max_distance: int) -> int:
+    """ The number of characters to insert, remove or change to turn a into b.
+    Stops early and returns max_distance + 1 once the distance is known to be larger than max_distance """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return previous[-1]
+
+
+def is_similar_stage_name(a: str, b: str) -> bool:
+    # stages that are only numbered differently, like "Stage 1" and "Stage 2", are different stages
+    if re.sub(r'\d', '', a) == re.sub(r'\d', '', b):
+        return a == b
+    # allow one typo in short names, and one more for every further 8 characters
+    max_distance = 1 + min(len(a), len(b)) // 8
+    return get_edit_distance(a, b, max_distance) <= max_distance
+
+
+def find_similar_stages(stage_names) -> list[list[str]]:
+    """ Group the stage names that are probably typos of each other """
+    normalized = [get_normalized_stage_name(name) for name in stage_names]
+
+    # every name starts in its own group, similar names join their groups
+    groups = list(range(len(stage_names)))
+
+    def get_group(i):
+        while groups[i] != i:
+            groups[i] = groups[groups[i]]
+            i = groups[i]
+        return i
+
+    for i in range(len(stage_names)):
+        for j in range(i + 1, len(stage_names)):
+            if is_similar_stage_name(normalized[i], normalized[j]):
+                groups[get_group(j)] = get_group(i)
+
+    similar = {}
+    for i in range(len(stage_names)):
+        group = get_group(i)
+        if group not in similar:
+            similar[group] = []
+        similar[group].append(stage_names[i])
+
+    return [names for names in similar.values() if len(names) > 1]
+
+
+def get_slot_hours(band: Band) -> tuple:
+    """ The start and end of a slot as hour values. An end before the start is on the next day,
+    e.g. 3:30 to 4:30 ends at 28.5 and not at 4.5, the same as in the calendar export """
+    start = get_hour_value(band.start)
+    end = get_hour_value(band.end)
+    if end < start:
+        end += 24
+
+    return start, end
+
+
+def find_overlaps(lineup: LineUp) -> list[tuple[Band, Band]]:
+    """ Sweep through every stage of every day by start time. A slot overlaps the slot
+    with the latest end before it, if that one ends after it started """
+    overlaps = []
+    for day in sorted(lineup.stage_slots):
+        for stage in sorted(lineup.stage_slots[day], key=lambda name: lineup.stage_ids[name]):
+            bands = sorted(lineup.stage_slots[day][stage], key=lambda b: get_hour_value(b.start))
+            latest = None
+            latest_end = 0
+            for band in bands:
+                start, end = get_slot_hours(band)
+                if latest is not None and latest_end > start:
+                    overlaps.append((latest, band))
+                if latest is None or end > latest_end:
+                    latest = band
+                    latest_end = end
+
+    return overlaps
+
+
+def find_invalid_times(lineup: LineUp) -> list[Band]:
+    # slots from 23:40 to 0:25 or from 3:30 to 4:30 are fine, they end after midnight or after 4 AM.
+    # only a slot ending when it starts is left
+    invalid_times = []
+    for band in lineup.bands:
+        start, end = get_slot_hours(band)
+        if end <= start:
+            invalid_times.append(band)
+
+    return invalid_times
+
+
+def lint_lineup(lineup: LineUp) -> LineUpLint:
+    return LineUpLint(find_similar_stages(lineup.stages), find_overlaps(lineup), find_invalid_times(lineup))
+
+
+def get_slot_str(band: Band) -> str:
+    return '{0} ({1}, {2}-{3}, {4})'.format(band.name, band.start.strftime('%d.%m.%Y'),
+                                             band.start.strftime('%H:%M'), band.end.strftime('%H:%M'), band.stage)
+
+
+def get_lint_messages(lint: LineUpLint, lineup: LineUp) -> list[str]:
+    stage_counts = {}
+    for band in lineup.bands:
+        stage_counts[band.stage] = stage_counts.get(band.stage, 0) + 1
+
+    messages = []
+    for names in lint.similar_stages:
+        # the stage with the fewest bands is most likely the typo
+        counts = ['"{0}" ({1} bands)'.format(name, stage_counts.get(name, 0)) for name in names]
+        messages.append('Stages with similar names: ' + ', '.join(counts))
+    for earlier, later in lint.overlaps:
+        messages.append('Overlapping slots: ' + get_slot_str(earlier) + ' and ' + get_slot_str(later))
+    for band in lint.invalid_times:
+        messages.append('Slot ends when it starts: ' + get_slot_str(band))
+
+    return messages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check a line-up for typos in stage names and overlapping slots')
+    parser.add_argument('lineup', help='the line-up .csv file')
+    args = parser.parse_args()
+
+    checked_lineup = parse_lineup(args.lineup, interactive=False)
+    if checked_lineup is None:
+        raise SystemExit(1)
+
+    lint_messages = get_lint_messages(lint_lineup(checked_lineup), checked_lineup)
+    for message in lint_messages:
+        print(message)
+    if len(lint_messages) > 0:
+        raise SystemExit(1)
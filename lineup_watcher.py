@@ -0,0 +1,114 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from collections import Counter
+
+from utils import build_lineup
+from utils import get_timeless_date
+from utils import is_lineup_data_line
+from utils import parse_lineup_line
+
+
+class LineUpWatcher:
+    """ Keeps the line-up of a file up to date while the file is being edited.
+    Every line is parsed only once: on a change, the lines of the file are compared to the ones
+    of the last parse and only added or changed lines are parsed again. """
+
+    def __init__(self, file_path, interactive: bool = True):
+        self.file_path = file_path
+        self.interactive = interactive
+        # the parsed band of every data line of the file
+        self.parsed_lines = {}
+        self.lines = Counter()
+        self.file_stat = None
+        self.lineup = None
+
+        self.update()
+
+    def get_file_stat(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    def has_changed(self) -> bool:
+        return self.get_file_stat() != self.file_stat
+
+    def update(self) -> set:
+        """ Parse the changes of the file into the line-up.
+        Returns the days affected by the changes, or None if the file could not be parsed.
+        If the stages changed, all days are affected """
+        self.file_stat = self.get_file_stat()
+
+        lines = []
+        line_numbers = {}
+        line_number = 0
+        for line in open(self.file_path, 'r', encoding='utf-8'):
+            line_number += 1
+            # the last line may miss its line break, it is still the same band though
+            if not line.endswith('\n'):
+                line += '\n'
+            if not is_lineup_data_line(line):
+                continue
+
+            lines.append(line)
+            if line not in line_numbers:
+                line_numbers[line] = line_number
+
+        new_lines = Counter(lines)
+        added_lines = new_lines - self.lines
+        removed_lines = self.lines - new_lines
+
+        # only parse what was added or changed, everything else is taken from the last parse
+        parsed_lines = {}
+        for line in added_lines:
+            if line in self.parsed_lines:
+                # just a duplicate of an existing line
+                parsed_lines[line] = self.parsed_lines[line]
+                continue
+
+            band = parse_lineup_line(line, line_numbers[line], self.interactive)
+            if band is None:
+                # keep the last valid line-up, the next change may fix the file
+                return None
+            parsed_lines[line] = band
+
+        affected_days = set()
+        for line in removed_lines:
+            affected_days.add(get_timeless_date(self.parsed_lines[line].start))
+        for line in added_lines:
+            affected_days.add(get_timeless_date(parsed_lines[line].start))
+
+        for line in new_lines:
+            if line not in parsed_lines:
+                parsed_lines[line] = self.parsed_lines[line]
+
+        old_stages = None
+        if self.lineup is not None:
+            old_stages = self.lineup.stages
+
+        self.parsed_lines = parsed_lines
+        self.lines = new_lines
+        self.lineup = build_lineup([parsed_lines[line] for line in lines])
+
+        # the columns of every day depend on all stages, a stage coming or going changes every day
+        if old_stages is not None and old_stages != self.lineup.stages:
+            affected_days |= set(self.lineup.dates)
+
+        return affected_days
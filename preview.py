@@ -0,0 +1,156 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+from dataclasses import fields
+from datetime import datetime
+
+from tkinter import Label
+from tkinter import OptionMenu
+from tkinter import StringVar
+
+import numpy as np
+from PIL import Image
+from PIL import ImageTk
+
+from classes import Settings
+
+from utils import draw_running_order_day
+from utils import get_enabled_stage_names
+from utils import get_selected_bands
+from utils import get_time_clashing_bands
+from utils import get_timeless_date
+
+
+# the preview only needs to be legible on screen, the print uses the resolution of the settings
+PREVIEW_DPI = 50
+# wait this long after the last change before drawing, so a quick series of clicks is drawn only once
+DEBOUNCE_MS = 300
+
+
+def get_preview_settings(settings) -> Settings:
+    preview_settings = Settings(**{f.name: getattr(settings, f.name) for f in fields(Settings)})
+    preview_settings.dpi = PREVIEW_DPI
+
+    return preview_settings
+
+
+class RunningOrderPreview:
+    """ Shows the running order of one day next to the band selection, and keeps it up to date while selecting.
+    The day is drawn in a low resolution in the render worker, only after the selection stopped changing for
+    a moment and only if the changed band plays on the shown day. The finished image is picked up by the main loop. """
+
+    def __init__(self, parent, render_worker, lineup, settings, stages, bands_dict, get_band_alias_dict,
+                 get_walking_times):
+        self.parent = parent
+        self.render_worker = render_worker
+        self.lineup = lineup
+        self.settings = settings
+        self.stages = stages
+        self.bands_dict = bands_dict
+        self.get_band_alias_dict = get_band_alias_dict
+        self.get_walking_times = get_walking_times
+
+        self.pending_render = None
+        # every render gets a number, so results of renders started before the last change are ignored
+        self.generation = 0
+        self.shown_generation = 0
+        self.results = queue.Queue()
+        self.is_checking = False
+        self.photo = None
+
+        day_strs = [day.strftime('%d.%m.%Y') for day in lineup.dates]
+        self.day_str = StringVar(parent)
+        if len(day_strs) > 0:
+            self.day_str.set(day_strs[0])
+            day_menu = OptionMenu(parent, self.day_str, *day_strs, command=lambda value: self.schedule_render())
+            day_menu.grid(row=0, column=0)
+        self.image_label = Label(master=parent, text="Preview")
+        self.image_label.grid(row=1, column=0)
+
+        for band, is_checked in bands_dict.items():
+            is_checked.trace_add('write', lambda *args, b=band: self.on_band_toggled(b))
+
+        self.schedule_render()
+
+    def get_day(self) -> datetime:
+        if self.day_str.get() == '':
+            return None
+        return datetime.strptime(self.day_str.get(), '%d.%m.%Y')
+
+    def on_band_toggled(self, band):
+        # bands of other days don't change what is shown
+        if get_timeless_date(band.start) == self.get_day():
+            self.schedule_render()
+
+    def schedule_render(self):
+        if self.pending_render is not None:
+            self.parent.after_cancel(self.pending_render)
+        self.pending_render = self.parent.after(DEBOUNCE_MS, self.start_render)
+
+    def start_render(self):
+        self.pending_render = None
+        day = self.get_day()
+        if day is None or not self.parent.winfo_exists():
+            return
+
+        # read out the gui state while still on the main thread
+        selection = get_selected_bands(self.lineup, self.bands_dict)
+        stage_names = get_enabled_stage_names(self.lineup, self.stages)
+
+        self.generation += 1
+        self.render_worker.submit(self.render, self.generation, day, selection, stage_names,
+                                  get_preview_settings(self.settings), self.get_band_alias_dict(),
+                                  self.get_walking_times())
+        if not self.is_checking:
+            self.is_checking = True
+            self.parent.after(50, self.check_results)
+
+    def render(self, generation, day, selection, stage_names, settings, band_alias_dict, walking_times):
+        # the selection changed again while this was waiting for the worker, only the latest one is shown
+        if generation != self.generation:
+            return
+
+        try:
+            clashing_bands = get_time_clashing_bands(selection, self.lineup, walking_times)
+            fig = draw_running_order_day(self.lineup, day, settings, stage_names, selection, clashing_bands,
+                                         band_alias_dict)
+            fig.canvas.draw()
+            self.results.put((generation, np.array(fig.canvas.buffer_rgba())))
+        except Exception as e:
+            print("Could not draw the preview: ", e)
+            self.results.put((generation, None))
+
+    def check_results(self):
+        if not self.parent.winfo_exists():
+            self.is_checking = False
+            return
+
+        latest = None
+        while not self.results.empty():
+            latest = self.results.get()
+
+        if latest is not None and latest[0] == self.generation:
+            self.shown_generation = latest[0]
+            if latest[1] is not None:
+                # tk images have to be created on the main thread
+                self.photo = ImageTk.PhotoImage(Image.fromarray(latest[1], 'RGBA'))
+                self.image_label.configure(image=self.photo, text='')
+
+        if self.shown_generation < self.generation:
+            self.parent.after(50, self.check_results)
+        else:
+            self.is_checking = False
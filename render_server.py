@@ -0,0 +1,244 @@
+# Personal Running Order Tool
+# Copyright (C) 2023  Tim Lobner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import astuple
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from classes import RunningOrderPrint
+from classes import Settings
+
+from utils import get_band_ordinals
+from utils import get_image_path
+from utils import parse_lineup
+from utils import parse_selection_lines
+from utils import render_running_order
+from utils import warm_up_render_stack
+
+
+# the settings a client may change, with the smallest and largest value allowed. a large dpi
+# needs a raster of several gigabytes, which would take the workers down for everyone
+QUERY_SETTINGS = {'dpi': (50, 600),
+                  'band_time_font_size': (4, 30),
+                  'band_name_font_size': (4, 30),
+                  'stage_name_font_size': (4, 30)}
+
+
+# the line-up of a worker process, it is parsed once when the process starts
+worker_lineup = None
+
+
+def init_worker(lineup_path):
+    global worker_lineup
+    worker_lineup = parse_lineup(lineup_path, interactive=False)
+    # the first request to a worker shouldn't wait for matplotlib to get ready
+    warm_up_render_stack(Settings())
+
+
+def render_selection(selection, settings, day=None) -> bytes:
+    """ Render the running order of a selection in a worker process and return the content of the file.
+    Renders a .pdf of all days, or if settings say so, a .png of the given day. Only that day is drawn then """
+    band_ordinals = get_band_ordinals(worker_lineup)
+    selected_bands = []
+    for band in selection:
+        if band in band_ordinals:
+            selected_bands.append(worker_lineup.bands[band_ordinals[band]])
+
+    days = None
+    if day is not None:
+        days = {day}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        running_order_print = RunningOrderPrint(os.path.join(temp_dir, 'running_order'))
+        render_running_order(running_order_print, worker_lineup, settings, selected_bands,
+                             list(worker_lineup.stages), days)
+
+        if settings.save_as_pdf:
+            file_path = running_order_print.save_path + '.pdf'
+        else:
+            file_path = get_image_path(running_order_print.save_path, day)
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+
+class RenderService:
+    """ Renders running orders for many clients at once.
+    The rendering happens in a fixed number of worker processes, with a limit for waiting renders.
+    Results are cached by line-up, selection and settings, so asking again doesn't render again. """
+
+    def __init__(self, lineup_path, max_workers=2, max_waiting=8, cache_size=64):
+        self.lineup = parse_lineup(lineup_path, interactive=False)
+        if self.lineup is None:
+            raise ValueError('Could not parse the line-up ' + lineup_path)
+        with open(lineup_path, 'rb') as f:
+            self.lineup_hash = hashlib.sha256(f.read()).hexdigest()
+
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(lineup_path,))
+        self.render_slots = threading.BoundedSemaphore(max_workers + max_waiting)
+        # the renders by their cache key. running renders are in here as well,
+        # so clients asking for the same render at the same time share it
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+
+    def render(self, selection, settings, day=None) -> bytes:
+        """ Returns the rendered file, or None if too many renders are waiting already """
+        selection = tuple(sorted(set(selection)))
+        key = (self.lineup_hash, selection, astuple(settings), day)
+
+        with self.lock:
+            future = self.cache.get(key)
+            if future is not None:
+                self.cache.move_to_end(key)
+            else:
+                if not self.render_slots.acquire(blocking=False):
+                    return None
+                future = self.pool.submit(render_selection, selection, settings, day)
+                future.add_done_callback(lambda f: self.render_slots.release())
+                self.cache[key] = future
+
+                # forget the renders used the longest time ago, but never one that is still running
+                for old_key in list(self.cache):
+                    if len(self.cache) <= self.cache_size:
+                        break
+                    if self.cache[old_key].done():
+                        del self.cache[old_key]
+
+        try:
+            return future.result()
+        except Exception:
+            # don't keep failed renders, the next request should try again
+            with self.lock:
+                if self.cache.get(key) is future:
+                    del self.cache[key]
+            raise
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """ GET /days lists the days of the line-up.
+    POST /render with the content of a .prot file renders it. The query may contain format=pdf|png
+    (a .png needs day=dd.mm.yyyy), as well as dpi and the font sizes named like in the settings """
+    service: RenderService = None
+
+    def send_content(self, status, content: bytes, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_text(self, status, text):
+        self.send_content(status, (text + '\n').encode('utf-8'), 'text/plain; charset=utf-8')
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/days':
+            self.send_text(404, 'Unknown path')
+            return
+
+        days = [day.strftime('%d.%m.%Y') for day in self.service.lineup.dates]
+        self.send_content(200, json.dumps(days).encode('utf-8'), 'application/json')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/render':
+            self.send_text(404, 'Unknown path')
+            return
+
+        query = parse_qs(url.query)
+
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            if content_length < 0:
+                raise ValueError('Content-Length must not be negative')
+            body = self.rfile.read(content_length)
+            selection = parse_selection_lines(body.decode('utf-8').splitlines())
+            file_format = query.get('format', ['pdf'])[0]
+            if file_format not in ('pdf', 'png'):
+                raise ValueError('format must be pdf or png')
+
+            day = None
+            if file_format == 'png':
+                if 'day' not in query:
+                    raise ValueError('a png needs a day')
+                day = datetime.strptime(query['day'][0], '%d.%m.%Y')
+                if day not in self.service.lineup.dates:
+                    raise ValueError('there are no bands on this day')
+
+            settings = Settings(save_as_image=int(file_format == 'png'), save_as_pdf=int(file_format == 'pdf'))
+            for name, (min_value, max_value) in QUERY_SETTINGS.items():
+                if name in query:
+                    value = int(query[name][0])
+                    if not min_value <= value <= max_value:
+                        raise ValueError('{0} must be between {1} and {2}'.format(name, min_value, max_value))
+                    setattr(settings, name, value)
+        except (ValueError, IndexError) as e:
+            self.send_text(400, 'Invalid request: ' + str(e))
+            return
+
+        try:
+            content = self.service.render(selection, settings, day)
+        except Exception as e:
+            self.send_text(500, 'Could not render the running order: ' + str(e))
+            return
+
+        if content is None:
+            self.send_text(503, 'Too many running orders are rendered right now, try again later')
+        elif file_format == 'pdf':
+            self.send_content(200, content, 'application/pdf')
+        else:
+            self.send_content(200, content, 'image/png')
+
+
+def create_server(lineup_path, host='0.0.0.0', port=8080, max_workers=2, max_waiting=8) -> ThreadingHTTPServer:
+    # every server gets its own handler class, so the service isn't shared between servers
+    handler = type('Handler', (RenderRequestHandler,),
+                   {'service': RenderService(lineup_path, max_workers, max_waiting)})
+
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve personal running orders of a line-up over http')
+    parser.add_argument('lineup', help='the line-up .csv file')
+    parser.add_argument('--host', default='0.0.0.0', help='the address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on')
+    parser.add_argument('--workers', type=int, default=2, help='number of parallel rendering processes')
+    parser.add_argument('--waiting', type=int, default=8, help='number of renders allowed to wait for a worker')
+    args = parser.parse_args()
+
+    server = create_server(args.lineup, args.host, args.port, args.workers, args.waiting)
+    print('Serving running orders on {0}:{1}'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.RequestHandlerClass.service.close()
+        server.server_close()
@@ -17,8 +17,12 @@
 
 import copy
 import datetime
+import heapq
+import io
 from datetime import datetime   # needed for access to strptime
 import os
+import string
+from concurrent.futures import ThreadPoolExecutor
 
 from tkinter import END
 from tkinter import filedialog
@@ -26,11 +30,13 @@ from tkinter import messagebox
 
 from custom_table import CustomTable
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.backends.backend_pdf as backend_pdf
+import numpy as np
+from PIL import Image
 
+from classes import Band
+from classes import CrewSelection
 from classes import LineUp
+from classes import RunningOrderPrint
 
 
 def get_timeless_date(dt) -> datetime:
@@ -46,6 +52,123 @@ def get_day_str(date: datetime) -> str:
     return date.strftime('%a')
 
 
+def get_hour_value(dt: datetime) -> float:
+    # the time of day as a float in hours, e.g. 23:30 -> 23.5
+    value = dt.time().hour + dt.time().minute / 60
+
+    # take care of a time wrap around at 0:00 AM! consider everything <4 as playing later, really
+    # this is not a clean approach (due to hardcoded 4), but should work in most cases
+    if value < 4:
+        value += 24
+
+    return value
+
+
+def is_lineup_data_line(line: str) -> bool:
+    # header, comment and empty lines are only for description and are ignored
+    return not (line.startswith('Band') or line.startswith('#') or line == "\n" or not line)
+
+
+def report_parsing_error(err_msg: str, interactive: bool = True):
+    if interactive:
+        messagebox.showerror('Parsing error', err_msg)
+    else:
+        print(err_msg)
+
+
+def parse_lineup_line(line: str, line_number: int, interactive: bool = True) -> Band:
+    """ Parse a single band of the line-up file. Returns None if the line is invalid """
+    data = line.split(',')
+    # set up the variables in this scope
+    name = ""
+    date = ""
+    start = ""
+    end = ""
+    stage = ""
+    try:
+        name = data[0]
+        date = data[1]
+        start = data[2]
+        end = data[3]
+        stage = data[4].replace('\n', '')
+    except:
+        print("Could not parse line ", line, " at line ", line_number)
+
+    date_object = ""
+    try:
+        date_object = datetime.strptime(date, '%d.%m.%Y')
+    except:
+        err_msg = 'Could not parse date on line ' + str(line_number) + '\n'
+        err_msg += 'Invalid line: ' + line
+        report_parsing_error(err_msg, interactive)
+        return None
+
+    # parse the time and fit the date to it for a correct datetime object
+    try:
+        start_time_object = datetime.strptime(start, '%H:%M')
+        end_time_object = datetime.strptime(end, '%H:%M')
+    except:
+        err_msg = 'Could not parse time on line ' + str(line_number) + '\n'
+        err_msg += 'Invalid line: ' + line
+        report_parsing_error(err_msg, interactive)
+        return None
+    date_object = date_object.replace(hour=start_time_object.hour)
+    date_object = date_object.replace(minute=start_time_object.minute)
+    end_time_object = end_time_object.replace(year=date_object.year)
+    end_time_object = end_time_object.replace(month=date_object.month)
+    end_time_object = end_time_object.replace(day=date_object.day)
+
+    return Band(name, stage, date_object, end_time_object)
+
+
+def build_lineup(bands: list) -> LineUp:
+    """ Create the line-up out of all bands, in the order they were listed in the file """
+    stage_names = []
+    stage_ids = {}
+    for band in bands:
+        if band.stage not in stage_ids:
+            stage_ids[band.stage] = len(stage_names)
+            stage_names.append(band.stage)
+
+    # sort the bands into the days, and within the days into the stages
+    days = {}
+    stage_slots = {}
+    for band in bands:
+        # for a check if the date was found before (and thus if an entry exists in the dictionary)
+        # the time needs to be equal. the days contain no times, therefore set them 0 here as well
+        date = get_timeless_date(band.start)
+
+        if not days.__contains__(date):
+            days[date] = []
+            stage_slots[date] = {}
+        if band.stage not in stage_slots[date]:
+            stage_slots[date][band.stage] = []
+
+        days[date].append(band)
+        stage_slots[date][band.stage].append(band)
+
+    return LineUp(stage_names, days, bands, stage_ids, stage_slots)
+
+
+def parse_lineup(file_path, interactive: bool = True) -> LineUp:
+    """ Parse the line-up from a file """
+    bands = []
+
+    # first thing is to increase the line number, so we can set it to 0, then we "start" at 1
+    line_number = 0
+    for line in open(file_path, 'r', encoding='utf-8'):
+        line_number += 1
+        if not is_lineup_data_line(line):
+            continue
+
+        band = parse_lineup_line(line, line_number, interactive)
+        if band is None:
+            return None
+        bands.append(band)
+
+    return build_lineup(bands)
+
+
 def browse_files(filetypes=(("All files", "*.*"),), entry_box=None):
     filename = filedialog.askopenfilename(initialdir=os.getcwd(),
                                           title="Select input data file",
@@ -58,14 +181,16 @@ def browse_files(filetypes=(("All files", "*.*"),), entry_box=None):
     return filename
 
 
-def save_settings(settings, settings_window, is_image, is_pdf, dpi,
-                  band_time_size, band_name_size, stage_name_size):
+def save_settings(settings, settings_window, is_image, is_pdf, dpi, thumbnail_dpi,
+                  band_time_size, band_name_size, stage_name_size, warm_up_render):
     settings.save_as_image = is_image.get()
     settings.save_as_pdf = is_pdf.get()
     settings.dpi = int(dpi.get())
+    settings.thumbnail_dpi = int(thumbnail_dpi.get())
     settings.band_time_font_size = int(band_time_size.get())
     settings.band_name_font_size = int(band_name_size.get())
     settings.stage_name_font_size = int(stage_name_size.get())
+    settings.warm_up_render = warm_up_render.get()
 
     settings_window.destroy()
 
@@ -175,22 +300,17 @@ def export_alias_settings(table: CustomTable):
     # don't use the tables export function, as it will only write to a csv file,
     # but won't allow for custom extension setting
 
-    data = get_alias_table_data(table)
+    if file_path == "":
+        return
 
-    f = open(file_path, "w")
-    i = 0
+    data = get_alias_table_data(table)
 
-    # write the column headers, otherwise the import won't work
-    f.write('Band name,Band alias\n')
+    with open(file_path, "w") as f:
+        # write the column headers, otherwise the import won't work
+        f.write('Band name,Band alias\n')
 
-    # write list of aliases to simple "csv" file, one line per band and alias
-    for band_name, band_alias in data.items():
-        f.write(band_name)
-        f.write(',')
-        f.write(band_alias)
-        if i < len(data) - 1:
-            f.write('\n')
-        i += 1
+        # write list of aliases to simple "csv" file, one line per band and alias
+        f.write('\n'.join(band_name + ',' + band_alias for band_name, band_alias in data.items()))
 
 
 def get_multi_bands(lineup: LineUp) -> dict:
@@ -233,15 +353,13 @@ def clear_selection(bands_selection):
         bands_selection[band].set(0)
 
 
-def import_selection(lineup, bands_selection):
-    # first get the file to read the selected bands
-    file_types = (("Personal Running Order text file", "*.prot*"), ("Text files", "*.txt*"), ("All files", "*.*"))
-    filepath = browse_files(file_types)
-    f = open(filepath, "r")
-
+def parse_selection_lines(lines) -> list:
     # the bands are one line each with the data and time comma separated as the next values
     selection = []
-    for line in f:
+    for line in lines:
+        if line == "\n" or not line:
+            continue
+
         split = line.split(",")
         band_name = split[0]
         date = split[1] + ' ' + split[2].removesuffix('\n')
@@ -249,6 +367,20 @@ def import_selection(lineup, bands_selection):
 
         selection.append((band_name, date_time))
 
+    return selection
+
+
+def read_selection_file(file_path) -> list:
+    with open(file_path, "r") as f:
+        return parse_selection_lines(f)
+
+
+def import_selection(lineup, bands_selection):
+    # first get the file to read the selected bands
+    file_types = (("Personal Running Order text file", "*.prot*"), ("Text files", "*.txt*"), ("All files", "*.*"))
+    filepath = browse_files(file_types)
+    selection = read_selection_file(filepath)
+
     # check if any of the bands don't exist. if so, this is an illegal file and the user should be made aware
     bands_to_remove = []
     for band in selection:
@@ -281,24 +413,58 @@ def export_selection(lineup: LineUp, bands_selection: dict):
 
     filetypes = (("Personal Running Order text file", "*.prot*"), ("Text file", "*.txt*"))
     filename = save_file_as_browser(filetypes)
+    if filename == "" or filename == ".prot":
+        return
 
     # write list of selected bands to simple text file, separated only by comma
-    f = open(filename, "w")
-    i = 0
-    for band in selected_bands:
-        f.write(band.name)
-        f.write(',')
-        date_str = band.start.strftime('%x')
-        f.write(date_str)
-        f.write(',')
-        time_str = band.start.strftime('%X')
-        f.write(time_str)
-        if i < len(selected_bands) - 1:
-            f.write('\n')
-        i += 1
-
-
-def get_time_clashing_bands(selection, lineup):
+    with open(filename, "w") as f:
+        f.write('\n'.join(band.name + ',' + band.start.strftime('%x') + ',' + band.start.strftime('%X')
+                          for band in selected_bands))
+
+
+def read_walking_times(file_path) -> dict:
+    """ Read the minutes it takes to walk between two stages.
+    Every line is "Stage A,Stage B,minutes". The way back takes as long, unless it is listed on its own """
+    walking_times = {}
+    one_way_times = {}
+    for line in open(file_path, 'r', encoding='utf-8'):
+        if line.startswith('#') or line == "\n" or not line:
+            continue
+
+        split = line.split(',')
+        from_stage = split[0]
+        to_stage = split[1]
+        minutes = float(split[2])
+
+        one_way_times[(from_stage, to_stage)] = minutes
+        walking_times[(from_stage, to_stage)] = minutes
+        if (to_stage, from_stage) not in one_way_times:
+            walking_times[(to_stage, from_stage)] = minutes
+
+    return walking_times
+
+
+def import_walking_times() -> dict:
+    file_types = (("Comma Separated Values", "*.csv*"), ("All files", "*.*"))
+    file_path = browse_files(file_types)
+    if file_path == "":
+        return None
+
+    return read_walking_times(file_path)
+
+
+def get_walking_time(walking_times, from_stage, to_stage) -> float:
+    # the time in hours it takes from the end of a band on one stage to the start of a band on another
+    if walking_times is None or from_stage == to_stage:
+        return 0
+
+    return walking_times.get((from_stage, to_stage), 0) / 60
+
+
+def get_time_clashing_bands(selection, lineup, walking_times=None):
+    """ Get all selected bands that overlap with another selected band.
+    If walking_times are given, bands on different stages also clash if there is not enough time
+    between them to walk from one stage to the other. """
     # for every band that is selected, read out the start and end time.
     # sort by day, then compare within each day each selected band
     clashing_bands = []
@@ -311,135 +477,232 @@ def get_time_clashing_bands(selection, lineup):
         band_date = get_timeless_date(band.start)
         selection_full_info[band_date].append(band)
 
+    # the longest walk from every stage to any other. a band that ended longer ago than that can't clash anymore
+    max_walking_times = {}
+    for stage in lineup.stages:
+        max_walking_times[stage] = max([get_walking_time(walking_times, stage, other) for other in lineup.stages],
+                                       default=0)
+
+    is_clashing = set()
     for date in selection_full_info:
-        bands_on_date = selection_full_info[date]
+        # sweep through the day by start time. for every stage, keep the bands still close enough
+        # to the current start to clash with it, ordered by their end
+        bands_on_date = sorted(selection_full_info[date], key=lambda b: get_hour_value(b.start))
+        ends = [get_hour_value(band.end) for band in bands_on_date]
+        frontiers = {}
         for i in range(len(bands_on_date)):
-            for j in range(i + 1, len(bands_on_date)):
-                band_i = bands_on_date[i]
-                band_j = bands_on_date[j]
-
-                # a band clashes, if either start or end of band_i is between start and end of band_j
-                # (or vice versa)
-                start_i = band_i.start.time().hour + band_i.start.time().minute / 60
-                end_i = band_i.end.time().hour + band_i.end.time().minute / 60
-                start_j = band_j.start.time().hour + band_j.start.time().minute / 60
-                end_j = band_j.end.time().hour + band_j.end.time().minute / 60
-
-                # take care of a time wrap around at 0:00 AM! consider everything <4 as playing later, really
-                # this is not a clean approach (due to hardcoded 4), but should work in most cases
-                if start_i < 4:
-                    start_i += 24
-                if end_i < 4:
-                    end_i += 24
-                if start_j < 4:
-                    start_j += 24
-                if end_j < 4:
-                    end_j += 24
-
-                if (
-                    ((start_i > start_j and start_i < end_j) or (end_i > start_j and end_i < end_j)) or\
-                    ((start_j > start_i and start_j < end_i) or (end_j > start_i and end_j < end_i))
-                    ):
-                    # there is a clash between these bands. add both to the clashing list
-                    if not clashing_bands.__contains__(band_i):
-                        clashing_bands.append(band_i)
-                    if not clashing_bands.__contains__(band_j):
-                        clashing_bands.append(band_j)
+            band_i = bands_on_date[i]
+            start_i = get_hour_value(band_i.start)
+
+            for stage, frontier in frontiers.items():
+                while frontier and frontier[0][0] + max_walking_times.get(stage, 0) <= start_i:
+                    heapq.heappop(frontier)
+
+                # a band started before band_i clashes, if band_i starts before it ends (plus the walk over)
+                walking_time = get_walking_time(walking_times, stage, band_i.stage)
+                for end_j, j in frontier:
+                    if end_j + walking_time > start_i:
+                        is_clashing.add(i)
+                        is_clashing.add(j)
+
+            if band_i.stage not in frontiers:
+                frontiers[band_i.stage] = []
+            heapq.heappush(frontiers[band_i.stage], (ends[i], i))
+
+        for i in sorted(is_clashing):
+            clashing_bands.append(bands_on_date[i])
+        is_clashing.clear()
 
     return clashing_bands
 
 
-def get_band_name(band_alias_dict: dict, band_name: str):
-    if band_name in band_alias_dict:
-        return band_alias_dict[band_name]
+def get_band_ordinals(lineup: LineUp) -> dict:
+    # map every slot onto its position in lineup.bands. the key is the same one a .prot file
+    # uses to identify a slot, i.e. the band name and its start
+    ordinals = {}
+    for i in range(len(lineup.bands)):
+        band = lineup.bands[i]
+        ordinals[(band.name, band.start)] = i
+
+    return ordinals
+
+
+def get_crew_selection(lineup: LineUp, selection_files, walking_times=None) -> CrewSelection:
+    """ Aggregate the .prot selections of a whole crew into counts per slot of the line-up.
+    Every selection becomes one row of a (selections x slots) matrix, so counting the picks and
+    the clashes is done with array operations instead of comparing the selections band by band."""
+    band_ordinals = get_band_ordinals(lineup)
+    num_bands = len(lineup.bands)
+
+    is_selected = np.zeros((len(selection_files), num_bands), dtype=bool)
+    for i in range(len(selection_files)):
+        for band in read_selection_file(selection_files[i]):
+            if band in band_ordinals:
+                is_selected[i, band_ordinals[band]] = True
+            else:
+                print("Could not find band ", band[0], " of selection ", selection_files[i])
+
+    starts = np.array([get_hour_value(band.start) for band in lineup.bands], dtype=float)
+    ends = np.array([get_hour_value(band.end) for band in lineup.bands], dtype=float)
+    stage_ids = np.array([lineup.stage_ids[band.stage] for band in lineup.bands], dtype=int)
+
+    # the time it takes to walk from one stage (row) to another (column)
+    stage_walking_times = np.zeros((len(lineup.stages), len(lineup.stages)))
+    for from_stage in lineup.stages:
+        for to_stage in lineup.stages:
+            stage_walking_times[lineup.stage_ids[from_stage], lineup.stage_ids[to_stage]] = \
+                get_walking_time(walking_times, from_stage, to_stage)
+
+    day_ids = np.zeros(num_bands, dtype=int)
+    for day_id, day in enumerate(lineup.dates):
+        for band in lineup.dates[day]:
+            day_ids[band_ordinals[(band.name, band.start)]] = day_id
+
+    # clashes can only happen within the same selection on the same day, so only the selected slots of one
+    # selection and day are compared with each other. each of these groups is a run in the sorted picks
+    pick_rows, pick_cols = np.nonzero(is_selected)
+    groups = pick_rows * len(lineup.dates) + day_ids[pick_cols]
+    order = np.argsort(groups, kind='stable')
+    pick_rows = pick_rows[order]
+    pick_cols = pick_cols[order]
+    _, group_starts, group_sizes = np.unique(groups[order], return_index=True, return_counts=True)
+
+    # every pick is paired with every pick of its group, including itself
+    pick_group_sizes = np.repeat(group_sizes, group_sizes)
+    pick_group_starts = np.repeat(group_starts, group_sizes)
+    first = np.repeat(np.arange(len(pick_cols)), pick_group_sizes)
+    pair_offsets = np.arange(len(first)) - np.repeat(np.cumsum(pick_group_sizes) - pick_group_sizes, pick_group_sizes)
+    second = np.repeat(pick_group_starts, pick_group_sizes) + pair_offsets
+
+    # two slots overlap, if each one starts before the other one ends (plus the walk over to it)
+    first_cols = pick_cols[first]
+    second_cols = pick_cols[second]
+    first_stages = stage_ids[first_cols]
+    second_stages = stage_ids[second_cols]
+    overlaps = ((starts[second_cols] < ends[first_cols] + stage_walking_times[first_stages, second_stages]) &
+                (starts[first_cols] < ends[second_cols] + stage_walking_times[second_stages, first_stages]) &
+                (first != second))
+
+    # a selected slot clashes, if the same selection contains at least one slot overlapping it
+    is_clashing = np.zeros_like(is_selected)
+    is_clashing[pick_rows[first[overlaps]], pick_cols[first[overlaps]]] = True
+
+    return CrewSelection(band_ordinals, is_selected.sum(axis=0), is_clashing.sum(axis=0), len(selection_files))
+
+
+def ask_crew_selection(lineup: LineUp, walking_times=None) -> CrewSelection:
+    file_types = (("Personal Running Order text file", "*.prot*"), ("Text files", "*.txt*"), ("All files", "*.*"))
+    selection_files = filedialog.askopenfilenames(initialdir=os.getcwd(),
+                                                  title="Select the selections of the crew",
+                                                  filetypes=file_types)
+    if len(selection_files) == 0:
+        # probably the user canceled
+        return None
 
-    return band_name
+    return get_crew_selection(lineup, list(selection_files), walking_times)
 
 
-def print_running_order(lineup, settings, stages, bands_dict=None, band_alias_dict=None):
-    # TODO: make this alternating for a stage
-    colors = ['lightgray', 'darkgray']
+def get_band_name(band_alias_dict: dict, band_name: str):
+    if band_alias_dict is not None and band_name in band_alias_dict:
+        return band_alias_dict[band_name]
 
-    # get the output path first. all images can be stored accordingly as individual files
-    save_path = save_file_as_browser()
-    if save_file_as_browser == "":
-        # probably the user canceled. therefore, just return here
-        return
+    return band_name
 
-    save_dir = os.path.dirname(save_path)
-    file_name = os.path.basename(save_path)
 
-    # read out the selected bands
+def get_selected_bands(lineup: LineUp, bands_dict=None) -> list:
+    # read out the selected bands. only bands still in the line-up count,
+    # as the line-up may have changed since the selection was made
     selection = []
     if bands_dict is not None:
+        lineup_bands = set(lineup.bands)
         for band in bands_dict:
-            if bands_dict[band].get() == 1:
+            if bands_dict[band].get() == 1 and band in lineup_bands:
                 selection.append(band)
 
-    # get the selected bands with time clashes
-    clashing_bands = get_time_clashing_bands(selection, lineup)
+    return selection
 
-    stage_names = lineup.stages
+
+def get_enabled_stage_names(lineup: LineUp, stages) -> list:
+    # the line-up itself is left as it is, so disabled stages can be enabled again for the next print
+    disabled_stage_names = set()
     for stage in stages:
-        if not stage.is_enabled() and stage.name in stage_names:
-            stage_names.remove(stage.name)
+        if not stage.is_enabled():
+            disabled_stage_names.add(stage.name)
+
+    stage_names = [stage for stage in lineup.stages if stage not in disabled_stage_names]
     print(stage_names)
-    figures = []
+
+    return stage_names
+
+
+def draw_running_order_day(lineup, day, settings, stage_names, selection, clashing_bands,
+                           band_alias_dict=None, crew_selection=None):
+    # matplotlib takes a while to import, so it is only imported by the thread drawing the running orders
+    from matplotlib import cm
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.patches as patches
+
+    # TODO: make this alternating for a stage
+    colors = ['lightgray', 'darkgray']
+
+    # create the basic plot figure. it is not managed by pyplot, so it can be drawn outside the GUI thread
+    # the figure has the dpi of the output, so it only needs to be laid out and drawn once for all outputs
+    fig = Figure(figsize=(11.69, 8.27), dpi=settings.dpi)
+    FigureCanvasAgg(fig)
+
+    # this is a bit hacky, but it gives out the correct time stamps for the wacken 2023 example
+    # and should work as long as the y_lim is kept to 27.3 - 10.9
+    hours = ["10:00", "12:00", "14:00", "16:00", "18:00", "20:00", "22:00", "0:00", "2:00"]
+
+    # the printed stages in the order of the line-up, with the column each one is printed in
+    stage_columns = lineup.get_stage_columns(stage_names)
+    stage_names = list(stage_columns)
+
+    # for readability of the resulting plot, offset the x position by 0.5
+    x_offset_axis = 0.5
+
+    # set axes (for bottom left first, then mirror for upper right)
+    axis_bl = fig.add_subplot(111)
+    axis_bl.yaxis.grid()
+    axis_bl.set_xlim(x_offset_axis, len(stage_names) + x_offset_axis)
+    # it will be read downwards, therefore invert the time labels on the axis
+    axis_bl.set_ylim(27.3, 10.9)
+    axis_bl.set_xticks(range(1, len(stage_names) + 1))
+    axis_bl.set_xticklabels(stage_names, rotation=30)
+    axis_bl.set_ylabel('Time')
+    axis_bl.set_yticklabels(hours)
+
+    axis_top = axis_bl.twiny()
+    axis_ur = axis_top.twinx()
+    axis_ur.set_xlim(axis_bl.get_xlim())
+    axis_ur.set_ylim(axis_bl.get_ylim())
+    axis_ur.set_xticks(axis_bl.get_xticks())
+    # TODO: rotation doesn't work here, for whatever reason
+    axis_ur.set_xticklabels(axis_bl.get_xticklabels())
+    axis_ur.set_ylabel('Time')
+    axis_ur.set_yticklabels(axis_bl.get_yticklabels())
 
     # set the stage name font size
-    plt.rc('xtick', labelsize=settings.stage_name_font_size)
+    axis_bl.tick_params(axis='x', labelsize=settings.stage_name_font_size)
+    axis_top.tick_params(axis='x', labelsize=settings.stage_name_font_size)
 
-    # loop all days, each day gets its own image
-    for day in lineup.dates:
-        # create the basic plot figure
-        fig = plt.figure(figsize=(11.69, 8.27))
-        # disable the plot's axes, they will be added in subplots
-        plt.axis('off')
-
-        # this is a bit hacky, but it gives out the correct time stamps for the wacken 2023 example
-        # and should work as long as the y_lim is kept to 27.3 - 10.9
-        hours = ["10:00", "12:00", "14:00", "16:00", "18:00", "20:00", "22:00", "0:00", "2:00"]
-
-        # for readability of the resulting plot, offset the x position by 0.5
-        x_offset_axis = 0.5
-
-        # set axes (for bottom left first, then mirror for upper right)
-        axis_bl = fig.add_subplot(111)
-        axis_bl.yaxis.grid()
-        axis_bl.set_xlim(x_offset_axis, len(stage_names) + x_offset_axis)
-        # it will be read downwards, therefore invert the time labels on the axis
-        axis_bl.set_ylim(27.3, 10.9)
-        axis_bl.set_xticks(range(1, len(stage_names) + 1))
-        axis_bl.set_xticklabels(stage_names, rotation=30)
-        axis_bl.set_ylabel('Time')
-        axis_bl.set_yticklabels(hours)
-
-        axis_ur = axis_bl.twiny().twinx()
-        axis_ur.set_xlim(axis_bl.get_xlim())
-        axis_ur.set_ylim(axis_bl.get_ylim())
-        axis_ur.set_xticks(axis_bl.get_xticks())
-        # TODO: rotation doesn't work here, for whatever reason
-        axis_ur.set_xticklabels(axis_bl.get_xticklabels())
-        axis_ur.set_ylabel('Time')
-        axis_ur.set_yticklabels(axis_bl.get_yticklabels())
-
-        # add all the band plots
-        for band in lineup.dates[day]:
-            stage = band.stage
-            if stage not in stage_names:
-                continue
-            start = band.start.time().hour + band.start.time().minute / 60
+    # add all the band plots. only the bands of the printed stages are looked at
+    for stage, column in stage_columns.items():
+        for band in lineup.stage_slots[day].get(stage, []):
             # assume that no band will play after 4!
             # this is a bit hacky, but we need some time wrap around at 23:59->0:00
-            if start < 4:
-                start += 24
-            end = band.end.time().hour + band.end.time().minute / 60
-            if end < 4:
-                end += 24
+            start = get_hour_value(band.start)
+            end = get_hour_value(band.end)
 
             # plot the band onto the correct stage
             col = 'lightgray'
-            if selection.__contains__(band):
+            if crew_selection is not None:
+                # the more people picked a band, the darker its green
+                count = crew_selection.get_count(band)
+                if count > 0:
+                    col = cm.Greens(0.25 + 0.75 * count / crew_selection.num_selections)
+            elif selection.__contains__(band):
                 if clashing_bands.__contains__(band):
                     col = 'red'
                 else:
@@ -449,20 +712,20 @@ def print_running_order(lineup, settings, stages, bands_dict=None, band_alias_di
             rectangle_width = 0.95
             # take into consideration the x_offset used for the x-axis
             x_offset = x_offset_axis + (1 - rectangle_width) * 0.5
-            band_rectangle = patches.Rectangle([stage_names.index(stage) + x_offset, start], rectangle_width,
+            band_rectangle = patches.Rectangle([column + x_offset, start], rectangle_width,
                                                end - start, color=col, linewidth=0.5)
             axis_bl.add_patch(band_rectangle)
 
             # print the actual start time to make it legible
             y_margin = 0.05
             start_time_str = str(band.start.time().hour) + ':' + str(band.start.time().minute).zfill(2)
-            plt.text(stage_names.index(stage) + x_offset, start + y_margin, start_time_str,
-                     va='top', fontsize=settings.band_time_font_size)
+            axis_ur.text(column + x_offset, start + y_margin, start_time_str,
+                         va='top', fontsize=settings.band_time_font_size)
             # also the end time on the opposite corner (thus preventing it from writing over the start time)
             # first, just plot the time to get the size of it (and plot it somewhere where it can't be seen)
             end_time_str = str(band.end.time().hour) + ':' + str(band.end.time().minute).zfill(2)
-            t = plt.text(-10, -10, end_time_str,
-                          va='top', fontsize=settings.band_time_font_size)
+            t = axis_ur.text(-10, -10, end_time_str,
+                             va='top', fontsize=settings.band_time_font_size)
             bb = t.get_window_extent(renderer=fig.canvas.get_renderer()).transformed(
                 axis_bl.transData.inverted())
 
@@ -470,36 +733,196 @@ def print_running_order(lineup, settings, stages, bands_dict=None, band_alias_di
             # that is: x = end_of_rectangle.x-text_width + x_offset
             # (where the x_offset is the one used for the x-axis)
             # and: y = end_of_rectangle.y-text_height
-            x_coord = stage_names.index(stage) + rectangle_width - bb.width + x_offset
+            x_coord = column + rectangle_width - bb.width + x_offset
             # for whatever reason, the bbox y value is negative, therefore add it here to avoid a double negative
             y_coord = end + bb.height
 
-            plt.text(x_coord, y_coord,
-                     end_time_str,
-                     va='top', fontsize=settings.band_time_font_size)
+            axis_ur.text(x_coord, y_coord,
+                         end_time_str,
+                         va='top', fontsize=settings.band_time_font_size)
 
             # print the name of the band
             band_name = get_band_name(band_alias_dict, band.name)
-            plt.text(stage_names.index(stage)+1, (start + end) * 0.5, band_name, ha='center', va='center',
-                     fontsize=settings.band_name_font_size)
-
-        day_str = day.strftime("%d.%m.%Y")
-        plt.title(day_str, y=1.07)
-        if settings.save_as_image:
-            file_path = os.path.join(save_dir, '{0}-{1}.png'.format(file_name, day_str))
-            plt.savefig(file_path, dpi=settings.dpi)
-            print('saving {0}'.format(file_path))
-        figures.append(fig)
-
-    # print it all as one pdf
+            if crew_selection is not None and crew_selection.get_count(band) > 0:
+                band_name += '\n' + str(crew_selection.get_count(band)) + '/' + str(crew_selection.num_selections)
+                clash_count = crew_selection.get_clash_count(band)
+                if clash_count > 0:
+                    band_name += ' (' + str(clash_count) + ' clashing)'
+            axis_ur.text(column+1, (start + end) * 0.5, band_name, ha='center', va='center',
+                         fontsize=settings.band_name_font_size)
+
+    day_str = day.strftime("%d.%m.%Y")
+    axis_ur.set_title(day_str, y=1.07)
+
+    return fig
+
+
+def warm_up_render_stack(settings):
+    """ Draw a tiny figure with texts in all font sizes of the settings, once as raster and once as .pdf.
+    matplotlib looks up fonts, loads glyphs and sets up its renderers only when they are first used,
+    so doing it beforehand makes the first print as fast as all later ones.
+    It has to run in the thread that draws the prints, matplotlib keeps the loaded fonts per thread """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.patches as patches
+    import matplotlib.backends.backend_pdf as backend_pdf
+
+    fig = Figure(figsize=(1, 1), dpi=settings.dpi)
+    FigureCanvasAgg(fig)
+    axis = fig.add_subplot(111)
+    axis.set_xticks([0.5])
+    axis.set_xticklabels(['Stage'], rotation=30)
+    axis.tick_params(axis='x', labelsize=settings.stage_name_font_size)
+    axis.add_patch(patches.Rectangle([0, 0], 1, 1, color='lightgray', linewidth=0.5))
+    axis.text(0, 0, '0123456789:', va='top', fontsize=settings.band_time_font_size)
+    # the band names may contain any letter, so load the glyphs of the usual ones
+    axis.text(0.5, 0.5, string.ascii_letters + 'äöüÄÖÜß', ha='center', va='center',
+              fontsize=settings.band_name_font_size)
+    fig.canvas.draw()
+
+    with backend_pdf.PdfPages(io.BytesIO()) as pdf:
+        pdf.savefig(fig)
+
+
+def get_image_path(save_path, day, suffix='') -> str:
+    day_str = day.strftime("%d.%m.%Y")
+    return os.path.join(os.path.dirname(save_path),
+                        '{0}-{1}{2}.png'.format(os.path.basename(save_path), day_str, suffix))
+
+
+def save_png(raster, file_path, dpi, thumbnail_path=None, thumbnail_dpi=0):
+    """ Encode an already drawn day as .png, and optionally as a smaller thumbnail """
+    image = Image.fromarray(raster, 'RGBA')
+    if file_path is not None:
+        image.save(file_path, dpi=(dpi, dpi))
+        print('saving {0}'.format(file_path))
+
+    if thumbnail_path is not None:
+        scale = thumbnail_dpi / dpi
+        thumbnail_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image.resize(thumbnail_size, Image.LANCZOS).save(thumbnail_path, dpi=(thumbnail_dpi, thumbnail_dpi))
+        print('saving {0}'.format(thumbnail_path))
+
+
+def ask_running_order_print(bands_dict=None, band_alias_dict=None, crew_selection=None,
+                            walking_times=None) -> RunningOrderPrint:
+    # get the output path first. all images can be stored accordingly as individual files
+    save_path = save_file_as_browser()
+    if save_path == "":
+        # probably the user canceled
+        return None
+
+    return RunningOrderPrint(save_path, bands_dict, band_alias_dict, crew_selection, walking_times)
+
+
+def get_figures_state(selection, stage_names, band_alias_dict, settings) -> tuple:
+    # everything a drawn day depends on, besides the line-up of the day itself
+    drawing_settings = (settings.dpi, settings.band_time_font_size, settings.band_name_font_size,
+                        settings.stage_name_font_size)
+    return frozenset(selection), tuple(stage_names), dict(band_alias_dict or {}), drawing_settings
+
+
+def render_running_order(running_order_print: RunningOrderPrint, lineup, settings, selection, stage_names,
+                         days=None, progress=None, cancel_event=None) -> bool:
+    """ Draw the days of the running order and save it to the path of the print.
+    Every day is drawn once and then written to all the outputs chosen in the settings.
+    If days is given, only these days are drawn. For a pdf all other days are reused from the last print,
+    otherwise they are left out. Days drawn with another selection, aliases, stages or settings are never reused.
+    This does not touch the GUI, so it can run in a worker thread: progress is called with the number of days
+    done and the total number of days, setting the cancel_event stops before the next day.
+    Returns False if the rendering was canceled, in which case no pdf is saved """
+    import matplotlib.backends.backend_pdf as backend_pdf
+
+    # get the selected bands with time clashes
+    clashing_bands = get_time_clashing_bands(selection, lineup, running_order_print.walking_times)
+
+    # the days of the last print look different if e.g. the selection changed since, then none can be reused
+    figures_state = get_figures_state(selection, stage_names, running_order_print.band_alias_dict, settings)
+    stored_figures = running_order_print.figures
+    if figures_state != running_order_print.figures_state:
+        stored_figures = {}
+
+    # the pdf needs a page for every day. days that were never drawn, e.g. because the last print was canceled,
+    # can't be reused for it and are drawn as well. images are only saved for the days asked for
+    days_to_draw = []
+    for day in lineup.dates:
+        if days is None or day in days or (settings.save_as_pdf and day not in stored_figures):
+            days_to_draw.append(day)
+
+    save_path = running_order_print.save_path
+    is_raster_needed = settings.save_as_image or settings.thumbnail_dpi > 0
+
+    # all pages are written to a temporary file first, so a canceled print doesn't leave half a pdf behind
+    pdf = None
+    pdf_path = save_path
     if settings.save_as_pdf:
-        if not save_path.endswith('.pdf'):
-            save_path += '.pdf'
-        pdf = backend_pdf.PdfPages(save_path)
-        for fig in figures:
-            pdf.savefig(fig)
+        if not pdf_path.endswith('.pdf'):
+            pdf_path += '.pdf'
+        pdf = backend_pdf.PdfPages(pdf_path + '.part')
+
+    # encoding the .png files is left to a pool, so it happens while the next day is drawn
+    figures = dict(stored_figures)
+    png_futures = []
+    num_drawn = 0
+    is_canceled = False
+    with ThreadPoolExecutor(max_workers=max(1, min(4, len(days_to_draw)))) as png_pool:
+        # each day gets its own image
+        for day in sorted(lineup.dates):
+            if cancel_event is not None and cancel_event.is_set():
+                is_canceled = True
+                break
 
+            if day in days_to_draw:
+                if progress is not None:
+                    progress(num_drawn, len(days_to_draw))
+
+                fig = draw_running_order_day(lineup, day, settings, stage_names, selection, clashing_bands,
+                                             running_order_print.band_alias_dict,
+                                             running_order_print.crew_selection)
+                figures[day] = fig
+                num_drawn += 1
+
+                if is_raster_needed:
+                    # draw once, then hand a copy of the pixels to the pool
+                    fig.canvas.draw()
+                    raster = np.array(fig.canvas.buffer_rgba())
+                    image_path = None
+                    if settings.save_as_image:
+                        image_path = get_image_path(save_path, day)
+                    thumbnail_path = None
+                    if settings.thumbnail_dpi > 0:
+                        thumbnail_path = get_image_path(save_path, day, '-thumbnail')
+                    png_futures.append(png_pool.submit(save_png, raster, image_path, settings.dpi,
+                                                       thumbnail_path, settings.thumbnail_dpi))
+
+            # the pdf is vector based, it can't reuse the pixels and is drawn on its own
+            if pdf is not None:
+                pdf.savefig(figures[day])
+
+        if not is_canceled and progress is not None:
+            progress(len(days_to_draw), len(days_to_draw))
+
+        # wait for the images, and pass on any error that happened while encoding them
+        for future in png_futures:
+            future.result()
+
+    if pdf is not None:
         pdf.close()
+        if is_canceled:
+            # the file is only created with the first page, a print canceled before it left nothing behind
+            if os.path.exists(pdf_path + '.part'):
+                os.remove(pdf_path + '.part')
+        else:
+            os.replace(pdf_path + '.part', pdf_path)
+
+    if is_canceled:
+        return False
+
+    # days that are gone from the line-up can't be printed anymore
+    for day in list(figures):
+        if day not in lineup.dates:
+            del figures[day]
+    running_order_print.figures = figures
+    running_order_print.figures_state = figures_state
 
-    # close the figures
-    plt.close('all')
+    return True